@@ -0,0 +1,347 @@
+import argparse
+import gzip
+import json
+import mimetypes
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+import warnings
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+import writer
+
+# Single-file output: the crawl streams every saved page and asset into FOLDER/mirror.zip or
+# FOLDER/mirror.warc[.gz] instead of writing loose files, and this module serves it back:
+# python archive.py ./out/mirror.zip --port 8000
+# Member names are the paths a loose-file mirror would have, so the rewritten links work unchanged.
+# Reruns and the relink pass append newer copies of names already in the archive; compacting it
+# afterwards keeps only the newest: python archive.py ./out/mirror.zip --compact
+
+FORMATS = ("zip", "warc", "warc.gz")
+ARCHIVE_NAME = "mirror"
+COPY_BUFFER = 1024 * 1024
+GZIP_LEVEL = 6
+# Already-compressed types are stored as they are (zip) or at the fastest gzip level (warc.gz);
+# deflating them again only costs CPU.
+COMPRESSED_TYPES = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".woff", ".woff2", ".gz", ".zip", ".mp4", ".mp3")
+
+def archive_path(base_folder, archive_format):
+    return os.path.join(base_folder, f"{ARCHIVE_NAME}.{archive_format}")
+
+def content_type(name):
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+class ArchiveWriter(writer.Writer):
+    # A writer stage that appends to one archive file. A single thread does the appending,
+    # so entries go in one after another; the queue cap still bounds the memory in flight.
+    # A name written again (a page the relink pass rewrote, an asset that changed since the
+    # last run) gets a newer entry after the old one, and every reader takes the newest.
+    def __init__(self, path, base_folder, bandwidth=None):
+        self.path = path
+        self.base_folder = base_folder
+        self.lock = threading.Lock()
+        self.names = set()
+        self.open_archive()
+        super().__init__(threads=1, bandwidth=bandwidth)
+
+    def member_name(self, path):
+        return os.path.relpath(path, self.base_folder).replace(os.sep, "/")
+
+    def exists(self, path):
+        with self.lock:
+            return self.member_name(path) in self.names
+
+    def read(self, path):
+        with self.lock:
+            return self.read_member(self.member_name(path))
+
+    def write_now(self, path, data, url=None):
+        if self.bandwidth is not None:
+            self.bandwidth.consume(len(data))
+        name = self.member_name(path)
+        with self.lock:
+            self.append(name, url, data=data)
+            self.names.add(name)
+
+    def store(self, path, part_path, url=None):
+        # Big downloads are copied in from their part file on the calling thread.
+        name = self.member_name(path)
+        try:
+            if self.bandwidth is not None:
+                self.bandwidth.consume(os.path.getsize(part_path))
+            with self.lock:
+                self.append(name, url, source=part_path)
+                self.names.add(name)
+        finally:
+            os.remove(part_path)
+
+    def close(self):
+        super().close()
+        with self.lock:
+            self.close_archive()
+
+class ZipWriter(ArchiveWriter):
+    # zipfile writes each entry as it comes and the central directory on close, so a run that
+    # dies without closing leaves an unreadable file; warc is the format that survives that.
+    def open_archive(self):
+        self.zip = zipfile.ZipFile(self.path, "a", allowZip64=True)
+        self.names.update(self.zip.namelist())
+
+    def append(self, name, url, data=None, source=None):
+        compression = zipfile.ZIP_STORED if name.lower().endswith(COMPRESSED_TYPES) else zipfile.ZIP_DEFLATED
+        with warnings.catch_warnings():
+            # A second entry under a name is how a replacement goes in; zipfile reads the newest.
+            warnings.filterwarnings("ignore", "Duplicate name", UserWarning)
+            if source is not None:
+                self.zip.write(source, name, compress_type=compression)
+                return
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = compression
+            self.zip.writestr(info, data)
+
+    def read_member(self, name):
+        try:
+            return self.zip.read(name)
+        except KeyError:
+            raise FileNotFoundError(name) from None
+
+    def close_archive(self):
+        self.zip.close()
+
+class WarcWriter(ArchiveWriter):
+    # WARC/1.1 resource records, one gzip member each for .warc.gz. PATH.idx gets a JSON line
+    # per record (name, url, offset, length) once the record is on disk, so the index never
+    # points at a half-written record and a reader can seek straight to any member.
+    def open_archive(self):
+        self.compressed = self.path.endswith(".gz")
+        self.file = open(self.path, "ab")
+        size = self.file.tell()
+        self.entries = {}
+        for entry in read_index(self.path + ".idx"):
+            if entry["offset"] + entry["length"] <= size:
+                self.entries[entry["name"]] = entry
+        self.names.update(self.entries)
+        self.index = open(self.path + ".idx", "a", encoding="utf-8")
+        if size == 0:
+            self.append_record({"WARC-Type": "warcinfo", "Content-Type": "application/warc-fields"},
+                               b"software: website-copier\r\nformat: WARC File Format 1.1\r\n")
+
+    def append(self, name, url, data=None, source=None):
+        headers = {"WARC-Type": "resource", "WARC-Target-URI": url or name, "Content-Type": content_type(name),
+                   "Copier-Local-Path": name}
+        offset, length = self.append_record(headers, data, source,
+                                            1 if name.lower().endswith(COMPRESSED_TYPES) else GZIP_LEVEL)
+        entry = {"name": name, "url": url, "offset": offset, "length": length}
+        self.index.write(json.dumps(entry) + "\n")
+        self.index.flush()
+        self.entries[name] = entry
+
+    def read_member(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            raise FileNotFoundError(name)
+        return read_record(self.path, entry)
+
+    def append_record(self, headers, data=None, source=None, level=GZIP_LEVEL):
+        # Returns (offset, length) of the record in the file.
+        size = len(data) if source is None else os.path.getsize(source)
+        head = {"WARC-Record-ID": f"<urn:uuid:{uuid.uuid4()}>",
+                "WARC-Date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), **headers, "Content-Length": size}
+        header_bytes = ("WARC/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in head.items()) + "\r\n").encode("utf-8")
+        offset = self.file.tell()
+        out = gzip.GzipFile(fileobj=self.file, mode="wb", compresslevel=level) if self.compressed else self.file
+        out.write(header_bytes)
+        if source is None:
+            out.write(data)
+        else:
+            with open(source, "rb") as f:
+                shutil.copyfileobj(f, out, COPY_BUFFER)
+        out.write(b"\r\n\r\n")
+        if self.compressed:
+            out.close()
+        self.file.flush()
+        return offset, self.file.tell() - offset
+
+    def close_archive(self):
+        self.file.close()
+        self.index.close()
+
+def copy_bytes(src, dst, length):
+    while length > 0:
+        chunk = src.read(min(COPY_BUFFER, length))
+        if not chunk:
+            break
+        dst.write(chunk)
+        length -= len(chunk)
+
+def open_writer(base_folder, archive_format, bandwidth=None):
+    path = archive_path(base_folder, archive_format)
+    if archive_format == "zip":
+        return ZipWriter(path, base_folder, bandwidth)
+    if archive_format in ("warc", "warc.gz"):
+        return WarcWriter(path, base_folder, bandwidth)
+    raise ValueError(f"unknown archive format {archive_format!r}")
+
+def compact(path):
+    # Rewrites an archive with only the newest entry for each name and returns how many older
+    # ones it dropped. Not while a crawl is writing to it.
+    if path.endswith(".zip"):
+        return compact_zip(path)
+    if path.endswith((".warc", ".warc.gz")):
+        return compact_warc(path)
+    raise ValueError(f"{path}: expected a .zip, .warc or .warc.gz archive")
+
+def compact_zip(path):
+    part_path = path + ".part"
+    with zipfile.ZipFile(path) as old:
+        infos = old.infolist()
+        latest = {info.filename: info for info in infos}
+        if len(latest) == len(infos):
+            return 0
+        with zipfile.ZipFile(part_path, "w", allowZip64=True) as new:
+            for info in latest.values():
+                with old.open(info) as src, \
+                        new.open(info, "w", force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER)
+    os.replace(part_path, path)
+    return len(infos) - len(latest)
+
+def compact_warc(path):
+    # Keeps the warcinfo record and the newest record for each name, and writes a new index.
+    size = os.path.getsize(path)
+    entries = [entry for entry in read_index(path + ".idx") if entry["offset"] + entry["length"] <= size]
+    latest = {entry["name"]: entry for entry in entries}
+    if len(latest) == len(entries):
+        return 0
+    first = min(entry["offset"] for entry in entries)
+    part_path = path + ".part"
+    with open(path, "rb") as old, open(part_path, "wb") as new, \
+            open(part_path + ".idx", "w", encoding="utf-8") as index:
+        copy_bytes(old, new, first)
+        for entry in sorted(latest.values(), key=lambda entry: entry["offset"]):
+            old.seek(entry["offset"])
+            entry["offset"] = new.tell()
+            copy_bytes(old, new, entry["length"])
+            index.write(json.dumps(entry) + "\n")
+    os.replace(part_path, path)
+    os.replace(part_path + ".idx", path + ".idx")
+    return len(entries) - len(latest)
+
+def read_record(path, entry):
+    # The content block of the record an index entry points at.
+    with open(path, "rb") as f:
+        f.seek(entry["offset"])
+        record = f.read(entry["length"])
+    if path.endswith(".gz"):
+        record = gzip.decompress(record)
+    head, _, block = record.partition(b"\r\n\r\n")
+    for line in head.split(b"\r\n"):
+        key, _, value = line.partition(b":")
+        if key.strip().lower() == b"content-length":
+            return block[:int(value)]
+    return block
+
+def read_index(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    entries = []
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            # A line cut short by a crash; everything before it is still good.
+            break
+    return entries
+
+class ZipReader:
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path)
+
+    def names(self):
+        return sorted(set(self.zip.namelist()))
+
+    def read(self, name):
+        try:
+            return self.zip.read(name)
+        except KeyError:
+            return None
+
+class WarcReader:
+    def __init__(self, path):
+        self.path = path
+        # Later records for a name replace earlier ones, the same as a rerun over loose files.
+        self.entries = {entry["name"]: entry for entry in read_index(path + ".idx")}
+
+    def names(self):
+        return sorted(self.entries)
+
+    def read(self, name):
+        entry = self.entries.get(name)
+        return None if entry is None else read_record(self.path, entry)
+
+def open_reader(path):
+    if path.endswith(".zip"):
+        return ZipReader(path)
+    if path.endswith((".warc", ".warc.gz")):
+        return WarcReader(path)
+    raise ValueError(f"{path}: expected a .zip, .warc or .warc.gz archive")
+
+def make_handler(reader):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = unquote(urlsplit(self.path).path).lstrip("/")
+            if not name or name.endswith("/"):
+                name += "index.html"
+            data = reader.read(name)
+            if data is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type(name))
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def serve(path, port=8000, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), make_handler(open_reader(path)))
+    print(f"Serving {path} on http://{host}:{server.server_address[1]}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Browse a mirror saved as a single archive.")
+    parser.add_argument("archive", help="mirror.zip, mirror.warc or mirror.warc.gz")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--list", action="store_true", help="print the member names and exit")
+    parser.add_argument("--compact", action="store_true",
+                        help="drop entries that newer ones with the same name replaced, and exit")
+    args = parser.parse_args(argv)
+    if args.compact:
+        print(f"{args.archive}: dropped {compact(args.archive)} replaced entries", file=sys.stderr)
+        return 0
+    if args.list:
+        for name in open_reader(args.archive).names():
+            print(name)
+        return 0
+    serve(args.archive, args.port, args.host)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,419 @@
+import asyncio
+import hashlib
+import os
+import time
+from urllib.parse import urldefrag, urlparse
+from copier import (JobState, sanitize_filename, get_asset_folder, check_size, open_part_file, discard_part_file,
+                    open_parse_pool, parse_page, rewrite_stylesheet, pause_flag, cancel_flag, asset_stats, run_stats,
+                    MAX_DEPTH, CRAWL_ORDER, CHUNK_SIZE, BUFFERED_ASSET_SIZE, CHECKPOINT_INTERVAL, PARSE_PROCESSES,
+                    VISITED_INDEX)
+import fetcher
+import html_rewrite
+import sitemap
+import writer
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+MAX_IN_FLIGHT = 256
+PER_HOST_LIMIT = 64
+PAGE_TASKS = 64
+TIMEOUT = 10
+
+current_job = None
+
+class AsyncCrawl(JobState):
+    def __init__(self, website_url, target_folder, tasks=PAGE_TASKS, order=CRAWL_ORDER, **options):
+        super().__init__(website_url, target_folder, **options)
+        self.tasks = tasks
+        self.order = order
+        self.session = None
+        self.parse_pool = None
+        self.frontier = None
+        self.assets = {}
+        self.saves = set()
+
+    def queued(self):
+        return self.frontier.qsize() if self.frontier is not None else 0
+
+    async def wait_if_paused(self):
+        while self.pause_flag.is_set():
+            await asyncio.sleep(0.1)
+            if self.cancel_flag.is_set():
+                return False
+        return not self.cancel_flag.is_set()
+
+    async def request(self, url, headers):
+        # The same per-host robots.txt rules and token buckets as fetcher.fetch, waited on
+        # with asyncio.sleep instead of blocking the loop.
+        policy = await asyncio.to_thread(fetcher.policy_for, url)
+        if not policy.allowed(url):
+            raise fetcher.RobotsDisallowed(f"robots.txt disallows {url}")
+        attempt = 0
+        while True:
+            wait = policy.reserve()
+            while wait:
+                await asyncio.sleep(wait)
+                wait = policy.reserve()
+            started = time.perf_counter()
+            response = await self.session.get(url, headers=headers)
+            self.metrics.observe("ttfb", time.perf_counter() - started)
+            policy.record(response.status, response.headers.get("Retry-After"))
+            if response.status not in fetcher.THROTTLE_STATUSES or attempt >= fetcher.THROTTLE_RETRIES:
+                return response
+            response.release()
+            await asyncio.sleep(fetcher.BACKOFF_FACTOR * 2 ** attempt)
+            attempt += 1
+
+    async def fetch_document(self, url):
+        # A sitemap or feed body, or None if there isn't one.
+        try:
+            async with await self.request(url, None) as response:
+                size = 0
+                chunks = []
+                if response.status == 200:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+                        chunks.append(chunk)
+                        if size > sitemap.MAX_DOCUMENT_SIZE:
+                            break
+                # Most of the probed paths don't exist on any given site; that isn't an error.
+                if response.status not in sitemap.MISSING_STATUSES:
+                    self.metrics.record_response(url, response.status, response.headers.get('Content-Type'), size)
+                self.count("bytes", size)
+                return b''.join(chunks) if response.status == 200 else None
+        except Exception as e:
+            self.metrics.record_error(url, e)
+            return None
+
+    async def seed(self):
+        # Fills the frontier from the site's sitemaps and feeds alongside the crawl.
+        try:
+            discovery = sitemap.Discovery(self.website_url,
+                                          await asyncio.to_thread(sitemap.robots_sitemaps, self.website_url))
+            url = discovery.next_url()
+            while url is not None and await self.wait_if_paused():
+                try:
+                    body = await self.fetch_document(url)
+                    items = self.seed_links(await asyncio.to_thread(discovery.read, url, body))
+                except Exception as e:
+                    self.log(f"Failed to read {url}: {e}")
+                    items = []
+                if items:
+                    self.log(f"Queued {len(items)} pages from {url}")
+                for item in items:
+                    self.frontier.put_nowait(item)
+                url = discovery.next_url()
+        except Exception as e:
+            self.log(f"Failed to read sitemaps: {e}")
+
+    async def download_asset(self, asset_url):
+        try:
+            if not await self.wait_if_paused():
+                return None
+            record = self.meta_store.get(asset_url, "asset")
+            if asset_url in self.checkpoint.done_assets and self.meta_store.has_local_copy(record):
+                return record["local_path"]
+            with self.metrics.timer("asset"):
+                return await self.fetch_asset_body(asset_url, record)
+        except Exception as e:
+            self.metrics.record_error(asset_url, e)
+            return None
+
+    async def fetch_asset_body(self, asset_url, record):
+        try:
+            headers = self.meta_store.conditional_headers(record)
+            async with await self.request(asset_url, headers) as response:
+                if response.status == 304 and headers:
+                    self.metrics.record_response(asset_url, 304, response.headers.get('Content-Type'), 0)
+                    self.count("unchanged")
+                    self.checkpoint.asset_done(asset_url)
+                    if record["assets"]:
+                        self.track(self.revalidate(asset_url, record))
+                    return record["local_path"]
+                content_type = response.headers.get('Content-Type', '')
+                if response.status != 200:
+                    self.metrics.record_response(asset_url, response.status, content_type, 0)
+                    return None
+                check_size(response.content_length or 0)
+                folder = os.path.join(self.base_folder, get_asset_folder(urlparse(asset_url).path.lower()))
+                # Same buffering as CopyJob.read_body; only oversized assets touch the
+                # disk from here, and then off the loop.
+                buffered = []
+                f = part_path = None
+                try:
+                    size = 0
+                    digest = hashlib.sha256()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+                        check_size(size)
+                        self.count("bytes", len(chunk))
+                        digest.update(chunk)
+                        if f is not None:
+                            await asyncio.to_thread(f.write, chunk)
+                            continue
+                        buffered.append(chunk)
+                        if size > BUFFERED_ASSET_SIZE:
+                            f, part_path = await asyncio.to_thread(open_part_file, folder)
+                            await asyncio.to_thread(f.writelines, buffered)
+                            buffered = None
+                    if f is not None:
+                        f.close()
+                except BaseException:
+                    if f is not None:
+                        f.close()
+                        discard_part_file(part_path)
+                    raise
+            sha256 = digest.hexdigest()
+            self.metrics.record_response(asset_url, 200, content_type, size)
+            body = part_path if f is not None else b''.join(buffered)
+            local_path, local_rel_path, stylesheet, saved = await asyncio.to_thread(
+                self.store_download, asset_url, body, sha256, content_type)
+            record = (local_rel_path, response.headers, sha256, None, stylesheet[2] if stylesheet else None)
+            if stylesheet:
+                text, refs, sub_assets = stylesheet
+                tasks = [self.fetch_asset(sub_url) for sub_url in sub_assets]
+                self.track(self.process_stylesheet(asset_url, local_path, local_rel_path, text, refs, tasks, record))
+            elif saved is not None:
+                await asyncio.wrap_future(saved)
+            if not stylesheet:
+                self.checkpoint.asset_done(asset_url)
+            self.meta_store.put(asset_url, "asset", *record)
+            return local_rel_path
+        except Exception as e:
+            self.metrics.record_error(asset_url, e)
+            return None
+
+    async def process_stylesheet(self, asset_url, local_path, local_rel_path, text, refs, tasks, record):
+        local_paths = await asyncio.gather(*tasks)
+        if self.cancel_flag.is_set():
+            return
+        with self.metrics.timer("rewrite"):
+            data = rewrite_stylesheet(local_rel_path, text, refs, local_paths)
+        try:
+            await self.write(local_path, data, asset_url)
+        except Exception as e:
+            self.write_failed(local_path, e)
+            return
+        self.meta_store.put(asset_url, "asset", *record, local_paths)
+        self.checkpoint.asset_done(asset_url)
+
+    async def revalidate(self, asset_url, record):
+        # Same as CopyJob.revalidate: an unchanged stylesheet whose references now resolve to
+        # other files is fetched in full again and rewritten.
+        local_paths = await asyncio.gather(*[self.fetch_asset(sub_url) for sub_url in record["assets"]])
+        if not self.cancel_flag.is_set() and list(local_paths) != record["asset_paths"]:
+            await self.fetch_asset_body(asset_url, None)
+
+    async def write(self, path, data, url):
+        # Writer.write can block while its queue is full, so the hand-over happens off the loop.
+        saved = await asyncio.to_thread(self.writer.write, path, data, self.metrics, url)
+        return await asyncio.wrap_future(saved)
+
+    def fetch_asset(self, asset_url):
+        asset_url = urldefrag(asset_url)[0]
+        task = self.assets.get(asset_url)
+        if task is not None:
+            self.asset_stats["hits"] += 1
+            return task
+        self.asset_stats["misses"] += 1
+        task = self.assets[asset_url] = asyncio.ensure_future(self.download_asset(asset_url))
+        return task
+
+    async def save_page(self, url, filename, text, assets, tasks, response_headers, sha256, links, asset_urls):
+        local_paths = await asyncio.gather(*tasks)
+        if self.cancel_flag.is_set():
+            return
+        replacements = []
+        for (_, _, start, end, quoted), local_asset_path in zip(assets, local_paths):
+            if local_asset_path:
+                replacements.append((start, end, quoted, local_asset_path))
+        with self.metrics.timer("rewrite"):
+            page = (await self.run_parse_step(html_rewrite.rewrite, text, replacements)).encode('utf-8')
+        html_path = os.path.join(self.base_folder, filename)
+        try:
+            await self.write(html_path, page, url)
+        except Exception as e:
+            self.write_failed(html_path, e)
+            return
+        self.meta_store.put(url, "page", filename, response_headers, sha256, links, asset_urls, local_paths)
+        self.log(f"Saved {url} -> {filename}")
+        self.page_saved(url)
+
+    async def reuse_page(self, url, record):
+        local_paths = await asyncio.gather(*[self.fetch_asset(asset_url) for asset_url in record["assets"]])
+        if self.cancel_flag.is_set():
+            return
+        if list(local_paths) != record["asset_paths"]:
+            # An asset was saved under a new name since the page was, as in CopyJob.reuse_page.
+            await self.copy_page(url, revalidate=False)
+        else:
+            self.page_saved(url)
+
+    async def run_parse_step(self, fn, *args):
+        # Without a parse pool this runs on the loop thread and blocks it for the duration.
+        if self.parse_pool is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.parse_pool, fn, *args)
+
+    def track(self, coro):
+        save = asyncio.ensure_future(coro)
+        self.saves.add(save)
+        save.add_done_callback(self.saves.discard)
+
+    async def copy_page(self, url, revalidate=True):
+        record = self.meta_store.get(url, "page")
+        headers = self.meta_store.conditional_headers(record) if revalidate else {}
+        status = None
+        try:
+            with self.metrics.timer("fetch"):
+                async with await self.request(url, headers) as response:
+                    status = response.status
+                    body = await response.read()
+            self.page_fetched(url, str(response.url))
+            self.metrics.record_response(url, status, response.headers.get('Content-Type'), len(body))
+            if status == 304 and headers:
+                self.count("unchanged")
+                self.track(self.reuse_page(url, record))
+                return record["links"]
+            response.raise_for_status()
+            self.count("bytes", len(body))
+            text = body.decode(response.get_encoding(), errors='replace')
+            sha256 = hashlib.sha256(body).hexdigest()
+            if revalidate and self.meta_store.has_local_copy(record) and record["sha256"] == sha256:
+                self.count("unchanged")
+                self.track(self.reuse_page(url, record))
+                return record["links"]
+            with self.metrics.timer("parse"):
+                assets, asset_urls, links = await self.run_parse_step(parse_page, str(response.url), text,
+                                                                      self.base_domains)
+        except Exception as e:
+            # HTTP error statuses were already counted by record_response.
+            if status is None or status < 400:
+                self.metrics.record_error(url, e)
+            self.log(f"Failed to load {url}: {e}")
+            return []
+
+        tasks = [self.fetch_asset(asset_url) for asset_url in asset_urls]
+
+        filename = sanitize_filename(urlparse(url).path)
+        self.track(self.save_page(url, filename, text, assets, tasks, response.headers, sha256, links, asset_urls))
+        return links
+
+    async def worker(self):
+        while True:
+            url, depth = await self.frontier.get()
+            try:
+                if not await self.wait_if_paused():
+                    continue
+                links = await self.copy_page(url)
+                for item in self.follow(links, depth):
+                    self.frontier.put_nowait(item)
+            finally:
+                self.frontier.task_done()
+
+    async def checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            self.checkpoint.flush()
+
+    async def run(self, session, parse_pool):
+        self.session = session
+        self.parse_pool = parse_pool
+        self.frontier = asyncio.LifoQueue() if self.order == "dfs" else asyncio.Queue()
+        for item in self.open():
+            self.frontier.put_nowait(item)
+        try:
+            checkpoints = asyncio.ensure_future(self.checkpoint_loop())
+            workers = [asyncio.ensure_future(self.worker()) for _ in range(max(1, self.tasks))]
+            if self.sitemaps:
+                # Seeding only ever adds to the frontier, so once it is done the join below
+                # covers everything it queued.
+                await self.seed()
+            await self.frontier.join()
+            for w in workers:
+                w.cancel()
+            while self.saves:
+                await asyncio.gather(*list(self.saves), return_exceptions=True)
+            checkpoints.cancel()
+        finally:
+            self.close()
+
+def stage_tracer(metrics):
+    # aiohttp reports DNS lookups and new connections separately; requests can't.
+    trace = aiohttp.TraceConfig()
+
+    def timed(stage):
+        async def on_start(session, context, params):
+            setattr(context, stage, time.perf_counter())
+
+        async def on_end(session, context, params):
+            metrics.observe(stage, time.perf_counter() - getattr(context, stage))
+
+        return on_start, on_end
+
+    dns_start, dns_end = timed("dns")
+    connect_start, connect_end = timed("connect")
+    trace.on_dns_resolvehost_start.append(dns_start)
+    trace.on_dns_resolvehost_end.append(dns_end)
+    trace.on_connection_create_start.append(connect_start)
+    trace.on_connection_create_end.append(connect_end)
+    return trace
+
+async def crawl(job, parse_pool):
+    # aiohttp keeps its own DNS cache (10 s by default); --dns-ttl stretches it. HTTP/2 isn't
+    # available here, the httpx transport only serves the threaded engine.
+    dns = {"ttl_dns_cache": fetcher.dns_cache.ttl} if fetcher.dns_cache else {}
+    connector = aiohttp.TCPConnector(limit=MAX_IN_FLIGHT, limit_per_host=PER_HOST_LIMIT, **dns)
+    headers = {"User-Agent": fetcher.USER_AGENT}
+    if fetcher.ACCEPT_ENCODING:
+        headers["Accept-Encoding"] = fetcher.ACCEPT_ENCODING
+    # TIMEOUT bounds connecting and each read, not the whole request, so a large asset that
+    # keeps streaming isn't cut off partway.
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=TIMEOUT, sock_read=TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[stage_tracer(job.metrics)],
+                                     headers=headers) as session:
+        await job.run(session, parse_pool)
+
+def run_job(job, parse_processes=PARSE_PROCESSES, write_bandwidth=None):
+    if aiohttp is None:
+        raise RuntimeError("The asyncio engine needs aiohttp (pip install aiohttp)")
+    fetcher.reset_policies()
+    parse_pool = open_parse_pool(parse_processes)
+    # JobState.open() swaps job.writer for the archive writer (and closes that itself), so
+    # the run's own writer is kept here to be closed.
+    run_writer = job.writer = writer.Writer(bandwidth=write_bandwidth)
+    try:
+        asyncio.run(crawl(job, parse_pool))
+    finally:
+        run_writer.close()
+        if parse_pool is not None:
+            parse_pool.shutdown(wait=True)
+
+def progress_snapshot():
+    job = current_job
+    if job is None:
+        return {"pages": run_stats["pages"], "bytes": run_stats["bytes"], "seen": 0, "queued": 0}
+    return job.progress_snapshot()
+
+def start_copy(website_url, target_folder, progress_callback, finish_callback,
+               max_depth=MAX_DEPTH, order=CRAWL_ORDER, resume=True, parse_processes=PARSE_PROCESSES,
+               visited_index=VISITED_INDEX, log_callback=None, workers=PAGE_TASKS, include=None, exclude=None):
+    global current_job
+    cancel_flag.clear()
+    job = AsyncCrawl(website_url, target_folder, tasks=workers, order=order, max_depth=max_depth, resume=resume,
+                     visited_index=visited_index, include=include, exclude=exclude,
+                     progress_callback=progress_callback, log_callback=log_callback,
+                     pause_flag=pause_flag, cancel_flag=cancel_flag)
+    current_job = job
+    try:
+        run_job(job, parse_processes)
+    finally:
+        asset_stats.update(job.asset_stats)
+        run_stats.update(job.run_stats)
+        current_job = None
+    job.print_summary()
+
+    finish_callback()
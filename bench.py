@@ -0,0 +1,240 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import fetcher
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Offline benchmark: python bench.py --pages 500 --fanout 8 --assets 6 --latency 0.01 --repeat 3
+# The synthetic site is generated on the fly from the options and a seed, so the same
+# options always serve the same site. It runs in its own process, and every copy runs in a
+# fresh process of its own, so the CPU time and peak RSS reported belong to the copier alone.
+
+SITE_DEFAULTS = {"pages": 200, "fanout": 8, "assets": 6, "asset_pool": 300, "asset_size": 20000,
+                 "latency": 0.0, "errors": 0.0, "seed": 1, "sitemap": False}
+
+class SyntheticSite:
+    # Page i links to page i + 1 (so every page is reachable) and fanout - 1 others picked by
+    # the seed. Assets come from a shared pool of asset_pool files, so caching and
+    # deduplication see realistic reuse: stylesheets pull in images through url(), and
+    # some of the images are byte-identical under different names.
+    def __init__(self, pages, fanout, assets, asset_pool, asset_size, latency, errors, seed, sitemap):
+        self.pages = pages
+        self.fanout = fanout
+        self.assets = assets
+        self.asset_pool = asset_pool
+        self.asset_size = asset_size
+        self.latency = latency
+        self.errors = errors
+        self.seed = seed
+        self.sitemap = sitemap
+
+    def page_path(self, i):
+        return "/" if i == 0 else f"/p/{i}.html"
+
+    def asset_name(self, j):
+        return f"/a/{j}" + (".css", ".js", ".png", ".png", ".png")[j % 5]
+
+    def failing(self, path):
+        digest = hashlib.blake2b(f"{self.seed}:{path}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little") / 2 ** 64 < self.errors
+
+    def page(self, i):
+        rng = random.Random(self.seed * 1_000_003 + i)
+        links = [(i + 1) % self.pages] + [rng.randrange(self.pages) for _ in range(self.fanout - 1)]
+        assets = [rng.randrange(self.asset_pool) for _ in range(self.assets)]
+        head = "".join(f'<link rel="stylesheet" href="{self.asset_name(j)}">' for j in assets if j % 5 == 0)
+        body = "".join(f'<script src="{self.asset_name(j)}"></script>' if j % 5 == 1
+                       else f'<img src="{self.asset_name(j)}" alt="">' for j in assets if j % 5)
+        nav = "".join(f'<li><a href="{self.page_path(n)}">Page {n}</a></li>' for n in links)
+        filler = "<p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>"
+        return (f"<!DOCTYPE html><html><head><title>Page {i}</title>{head}</head>"
+                f"<body><h1>Page {i}</h1><ul>{nav}</ul>{filler}{body}</body></html>").encode()
+
+    def asset(self, j):
+        if j % 5 == 0:
+            refs = [(j + k) % self.asset_pool for k in (2, 3, 4)]
+            css = "".join(f".c{k} {{ background: url({self.asset_name(k)}) }}\n" for k in refs)
+            return css.encode(), "text/css"
+        if j % 5 == 1:
+            return f"console.log({j});\n".encode() * max(1, self.asset_size // 64), "text/javascript"
+        # Every tenth image repeats an earlier one's bytes.
+        seed = j - 5 if j % 10 == 9 and j >= 5 else j
+        return random.Random(seed).randbytes(self.asset_size), "image/png"
+
+    def sitemap_xml(self):
+        locs = "".join(f"<url><loc>{self.page_path(i)}</loc></url>" for i in range(self.pages))
+        return f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</urlset>'.encode()
+
+    def respond(self, path):
+        # Returns (status, content type, body).
+        if self.failing(path):
+            return 500, "text/plain", b"injected error"
+        if path == "/sitemap.xml" and self.sitemap:
+            return 200, "application/xml", self.sitemap_xml()
+        if path == "/" or path.startswith("/p/"):
+            try:
+                i = 0 if path == "/" else int(path[3:].removesuffix(".html"))
+            except ValueError:
+                return 404, "text/plain", b"not found"
+            if 0 <= i < self.pages:
+                return 200, "text/html; charset=utf-8", self.page(i)
+        elif path.startswith("/a/"):
+            try:
+                j = int(path[3:].split(".")[0])
+            except ValueError:
+                return 404, "text/plain", b"not found"
+            if 0 <= j < self.asset_pool:
+                body, content_type = self.asset(j)
+                return 200, content_type, body
+        return 404, "text/plain", b"not found"
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 so the copier's keep-alive pools are exercised as they would be on a real server.
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if site.latency:
+                time.sleep(site.latency)
+            status, content_type, body = site.respond(self.path.split("?")[0])
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections at the end of a run is expected.
+        pass
+
+def serve(site_options, port, ready=None):
+    server = QuietServer(("127.0.0.1", port), make_handler(SyntheticSite(**site_options)))
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def cpu_seconds():
+    if resource is None:
+        return time.process_time()
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+def run_once(url, config, results):
+    # Runs in a fresh process; config holds the copier settings for this run.
+    import mirror
+    fetcher.HOST_RATE = config["rate"]
+    if config["rate"] is not None:
+        fetcher.HOST_BURST = max(fetcher.HOST_BURST, int(config["rate"]))
+    folder = tempfile.mkdtemp(prefix="copier-bench-")
+    try:
+        cpu_start = cpu_seconds()
+        started = time.perf_counter()
+        report = mirror.copy_site(url, folder, engine=config["engine"], workers=config["workers"],
+                                  parse_processes=config["parse_processes"], resume=False)
+        seconds = time.perf_counter() - started
+        cpu = cpu_seconds() - cpu_start
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    results.put({"pages": report["pages"], "bytes": report["bytes"], "seconds": round(seconds, 3),
+                 "pages_per_s": round(report["pages"] / seconds, 1),
+                 "mb_per_s": round(report["bytes"] / 1e6 / seconds, 2),
+                 "peak_rss_mb": peak_rss_mb(), "cpu_s": round(cpu, 2)})
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the copier against a local synthetic site.")
+    parser.add_argument("--pages", type=int, default=SITE_DEFAULTS["pages"])
+    parser.add_argument("--fanout", type=int, default=SITE_DEFAULTS["fanout"], help="links per page")
+    parser.add_argument("--assets", type=int, default=SITE_DEFAULTS["assets"], help="assets per page")
+    parser.add_argument("--asset-pool", type=int, default=SITE_DEFAULTS["asset_pool"], help="distinct assets")
+    parser.add_argument("--asset-size", type=int, default=SITE_DEFAULTS["asset_size"], help="bytes per image")
+    parser.add_argument("--latency", type=float, default=SITE_DEFAULTS["latency"], help="seconds per response")
+    parser.add_argument("--errors", type=float, default=SITE_DEFAULTS["errors"], help="fraction of URLs failing")
+    parser.add_argument("--seed", type=int, default=SITE_DEFAULTS["seed"])
+    parser.add_argument("--sitemap", action="store_true", help="serve /sitemap.xml listing every page")
+    parser.add_argument("--engine", choices=("threads", "asyncio"), default="threads")
+    parser.add_argument("-w", "--workers", type=int)
+    parser.add_argument("--parse-processes", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=fetcher.HOST_RATE,
+                        help="cap on requests per second per host (default: the copier's own, fetcher.HOST_RATE)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--serve", type=int, metavar="PORT", help="only serve the site on PORT")
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    site_options = {"pages": args.pages, "fanout": args.fanout, "assets": args.assets,
+                    "asset_pool": args.asset_pool, "asset_size": args.asset_size, "latency": args.latency,
+                    "errors": args.errors, "seed": args.seed, "sitemap": args.sitemap}
+    if args.serve is not None:
+        print(f"Serving on http://127.0.0.1:{args.serve}/", file=sys.stderr)
+        serve(site_options, args.serve)
+        return 0
+    config = {"engine": args.engine, "workers": args.workers, "parse_processes": args.parse_processes,
+              "rate": args.rate}
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    server = context.Process(target=serve, args=(site_options, 0, ready), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{ready.get()}/"
+    runs = []
+    if not args.json:
+        rate = "uncapped (backs off on 429/503)" if args.rate is None else f"{args.rate:g} req/s"
+        print(f"{args.engine} engine, per-host rate {rate}", file=sys.stderr)
+    try:
+        for _ in range(args.repeat):
+            results = context.Queue()
+            run = context.Process(target=run_once, args=(url, config, results))
+            run.start()
+            run.join()
+            if run.exitcode:
+                print(f"benchmark run failed with exit code {run.exitcode}", file=sys.stderr)
+                return 1
+            runs.append(results.get())
+            if not args.json:
+                r = runs[-1]
+                print(f"{r['pages']} pages, {r['bytes'] / 1e6:.1f} MB in {r['seconds']}s: "
+                      f"{r['pages_per_s']} pages/s, {r['mb_per_s']} MB/s, "
+                      f"peak RSS {r['peak_rss_mb']} MB, CPU {r['cpu_s']}s")
+    finally:
+        server.terminate()
+    summary = {key: round(statistics.median(r[key] for r in runs), 3)
+               for key in ("seconds", "pages_per_s", "mb_per_s", "peak_rss_mb", "cpu_s") if runs[0][key] is not None}
+    if args.json:
+        print(json.dumps({"site": site_options, "config": config, "runs": runs, "median": summary}, indent=2))
+    elif len(runs) > 1:
+        print("median: " + ", ".join(f"{key} {value}" for key, value in summary.items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
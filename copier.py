@@ -0,0 +1,924 @@
+import hashlib
+import mimetypes
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urldefrag, urljoin, urlparse
+import re
+import fetcher
+import html_rewrite
+import css_rewrite
+import metrics
+import urlnorm
+import writer
+import archive
+import relink
+import sitemap
+from metastore import MetaStore, Checkpoint, STATE_DIR
+
+MAX_WORKERS = 8
+MAX_DEPTH = None
+CRAWL_ORDER = "bfs"
+ASSET_WORKERS = 16
+PER_HOST_ASSET_LIMIT = 6
+CHUNK_SIZE = 64 * 1024
+MAX_ASSET_SIZE = 100 * 1024 * 1024
+# Assets up to this size are held in memory and handed to the writer stage; bigger ones
+# are streamed to a part file by the downloading thread.
+BUFFERED_ASSET_SIZE = 4 * 1024 * 1024
+CHECKPOINT_INTERVAL = 5
+PARSE_PROCESSES = 0
+VISITED_INDEX = "set"
+OBJECT_NAME_LENGTH = 32
+
+# Flags and totals for start_copy(), the one-site-at-a-time entry point the GUI uses.
+# Batch runs give every CopyJob its own.
+pause_flag = threading.Event()
+cancel_flag = threading.Event()
+asset_stats = {"hits": 0, "misses": 0}
+run_stats = {"unchanged": 0, "deduplicated": 0, "pages": 0, "bytes": 0, "relinked": 0, "seeded": 0}
+current_job = None
+
+def sanitize_filename(path):
+    name = os.path.basename(path)
+    if not name or '.' not in name:
+        name = 'index.html' if path == '/' else path.strip('/').replace('/', '_') + '.html'
+    return re.sub(r'[^\w\-_\.]', '_', name)
+
+def get_asset_folder(asset_url):
+    if asset_url.endswith('.css'):
+        return 'assets/css'
+    elif asset_url.endswith('.js'):
+        return 'assets/js'
+    elif asset_url.endswith(('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.bmp')):
+        return 'assets/images'
+    else:
+        return 'assets/other'
+
+class AssetTooLarge(Exception):
+    pass
+
+def check_size(size):
+    if MAX_ASSET_SIZE is not None and size > MAX_ASSET_SIZE:
+        raise AssetTooLarge(f"{size} bytes exceeds the {MAX_ASSET_SIZE} byte limit")
+
+def asset_object_path(asset_url, digest, content_type=''):
+    # Assets are stored under the hash of their content, so different files that share a
+    # basename can't overwrite each other and identical bytes behind several URLs
+    # (CDN mirrors, cache-busting query strings) are written once and referenced by all.
+    path = urlparse(asset_url).path
+    ext = os.path.splitext(path)[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,8}', ext):
+        ext = mimetypes.guess_extension(content_type.split(';')[0].strip()) or ''
+    return get_asset_folder(path.lower()) + '/' + digest[:OBJECT_NAME_LENGTH] + ext
+
+def open_part_file(folder):
+    # Bytes land in a temporary file in the destination folder and are renamed into place
+    # only when complete, so a failed or oversized download never leaves a truncated asset.
+    fd, part_path = writer.make_temp_file(folder)
+    return os.fdopen(fd, 'wb'), part_path
+
+def discard_part_file(part_path):
+    try:
+        os.remove(part_path)
+    except OSError:
+        pass
+
+def is_stylesheet(asset_url, content_type):
+    return urlparse(asset_url).path.endswith('.css') or content_type.split(';')[0].strip() == 'text/css'
+
+def read_stylesheet(local_path):
+    with open(local_path, 'rb') as f:
+        return f.read().decode('utf-8', 'surrogateescape')
+
+def rewrite_stylesheet(local_rel_path, text, refs, local_paths):
+    # Runs once every url()/@import target of the stylesheet has resolved; returns the bytes
+    # to store, pointing at the local copies that made it.
+    replacements = []
+    for (_, start, end), sub_path in zip(refs, local_paths):
+        if sub_path:
+            replacements.append((start, end, css_rewrite.relative_path(sub_path, local_rel_path)))
+    return css_rewrite.rewrite(text, replacements).encode('utf-8', 'surrogateescape')
+
+def parse_page(url, text, base_domains):
+    assets, anchors = html_rewrite.scan(text)
+    links = []
+    for href, _, _, _ in anchors:
+        link = urlnorm.canonicalize(urljoin(url, href))
+        parsed_link = urlparse(link)
+        if parsed_link.netloc in base_domains and parsed_link.scheme in ["http", "https"]:
+            links.append(link)
+    asset_urls = [urljoin(url, value) for _, value, _, _, _ in assets]
+    return assets, asset_urls, links
+
+def open_parse_pool(processes):
+    # Spawned rather than forked: the crawl's threads are already running, and a forked child
+    # can inherit a lock one of them was holding.
+    if not processes:
+        return None
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+
+def when_all(futures, callback):
+    if not futures:
+        callback()
+        return
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            callback()
+
+    for future in futures:
+        future.add_done_callback(done)
+
+class JobState:
+    # Everything one site copy owns: seen URLs, pause/cancel flags, caches, counters and
+    # the state database, so several copies can run in one process. Both engines build on it.
+    def __init__(self, website_url, target_folder, max_depth=MAX_DEPTH, resume=True, visited_index=VISITED_INDEX,
+                 include=None, exclude=None, progress_callback=None, log_callback=None,
+                 pause_flag=None, cancel_flag=None, live_metrics=False, archive_format=None, relink=True,
+                 sitemaps=True):
+        self.website_url = urlnorm.canonicalize(website_url)
+        self.base_folder = target_folder
+        # The site's hosts: the start URL's, plus the one it redirects to if that differs.
+        self.base_domains = (urlparse(self.website_url).netloc,)
+        self.max_depth = max_depth
+        self.resume = resume
+        self.include = include
+        self.exclude = exclude
+        self.progress_callback = progress_callback
+        self.log_sink = log_callback
+        self.pause_flag = threading.Event() if pause_flag is None else pause_flag
+        self.cancel_flag = threading.Event() if cancel_flag is None else cancel_flag
+        self.visited = urlnorm.VisitedIndex(visited_index)
+        self.visited_lock = threading.Lock()
+        self.asset_stats = {"hits": 0, "misses": 0}
+        self.run_stats = {"unchanged": 0, "deduplicated": 0, "pages": 0, "bytes": 0, "relinked": 0, "seeded": 0}
+        self.stats_lock = threading.Lock()
+        self.css_cache = {}
+        self.css_cache_lock = threading.Lock()
+        self.objects = set()
+        self.objects_lock = threading.Lock()
+        self.bandwidth = None
+        self.writer = None
+        self.archive_format = archive_format
+        self.relink = relink
+        self.sitemaps = sitemaps
+        self.metrics = metrics.Metrics()
+        self.live_metrics = live_metrics
+        self.meta_store = None
+        self.checkpoint = None
+        self.state_lock = threading.Lock()
+        self.closed = False
+        self.start_time = None
+        self.end_time = None
+
+    def log(self, message):
+        if self.log_sink is not None:
+            self.log_sink(message)
+
+    def count(self, key, amount=1):
+        with self.stats_lock:
+            self.run_stats[key] += amount
+
+    def count_bytes(self, size):
+        self.count("bytes", size)
+        if self.bandwidth is not None:
+            self.bandwidth.consume(size)
+
+    def queued(self):
+        return 0
+
+    def progress_snapshot(self):
+        # Cheap enough to poll from the GUI thread on a timer.
+        return {"pages": self.run_stats["pages"], "bytes": self.run_stats["bytes"], "seen": len(self.visited),
+                "queued": self.queued()}
+
+    def open(self):
+        # Opens the state database and returns the (url, depth) pairs to start from: the
+        # unfinished part of an earlier crawl of the same site, or just the start page.
+        os.makedirs(self.base_folder, exist_ok=True)
+        if self.archive_format is not None:
+            # The job gets its own single-threaded writer for the archive, keeping the
+            # run's write budget if there is one.
+            shared = self.writer
+            self.writer = archive.open_writer(self.base_folder, self.archive_format,
+                                              shared.bandwidth if shared is not None else None)
+        self.meta_store = MetaStore(self.base_folder, exists=self.writer.exists)
+        self.checkpoint = Checkpoint(self.meta_store, self.website_url)
+        self.start_time = self.metrics.started = time.time()
+        if self.live_metrics:
+            self.metrics.start_live(os.path.join(self.base_folder, STATE_DIR, "metrics.json"),
+                                    lambda: {"url": self.website_url, "progress": self.progress_snapshot()})
+        saved_state = self.checkpoint.load() if self.resume else None
+        if saved_state and saved_state[1]:
+            self.visited.update(saved_state[0])
+            return saved_state[1]
+        self.checkpoint.start()
+        self.mark_visited(self.website_url)
+        self.checkpoint.page_queued(self.website_url, 0)
+        return [(self.website_url, 0)]
+
+    def flush_checkpoint(self):
+        with self.state_lock:
+            if not self.closed:
+                self.checkpoint.flush()
+
+    def close(self):
+        with self.state_lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.relink and not self.cancel_flag.is_set():
+                self.relink_pages()
+            if self.archive_format is not None:
+                self.writer.close()
+            if self.cancel_flag.is_set():
+                self.checkpoint.flush()
+            else:
+                self.checkpoint.finish()
+            self.meta_store.close()
+        self.end_time = time.time()
+        self.metrics.stop_live()
+        self.write_report()
+
+    def relink_pages(self):
+        # Points saved pages' <a href>s at the local copies of their targets; a canceled
+        # run leaves this to the run that finishes the crawl.
+        try:
+            with self.metrics.timer("relink"):
+                self.count("relinked", relink.relink_pages(self.meta_store, self.writer, self.base_folder, self.log))
+        except Exception as e:
+            self.log(f"Failed to relink pages: {e}")
+
+    def write_report(self):
+        # <target>/.copier/report.json and report.csv describe the run that just ended.
+        state_dir = os.path.join(self.base_folder, STATE_DIR)
+        self.metrics.write_json(os.path.join(state_dir, "report.json"),
+                                {"url": self.website_url, "canceled": self.cancel_flag.is_set(),
+                                 "run_stats": dict(self.run_stats), "asset_stats": dict(self.asset_stats)})
+        self.metrics.write_csv(os.path.join(state_dir, "report.csv"))
+
+    def mark_visited(self, url):
+        with self.visited_lock:
+            return self.visited.add(url)
+
+    def follow(self, links, depth):
+        # Returns the (link, depth + 1) pairs worth queuing from a page at depth.
+        if self.cancel_flag.is_set() or (self.max_depth is not None and depth >= self.max_depth):
+            return []
+        items = []
+        for link in links:
+            if urlnorm.url_allowed(link, self.include, self.exclude) and self.mark_visited(link):
+                self.checkpoint.page_queued(link, depth + 1)
+                items.append((link, depth + 1))
+        return items
+
+    def page_fetched(self, url, final_url):
+        # A start URL that redirects to another host (example.com -> www.example.com) brings
+        # that host into the site, since every link on the start page resolves against it.
+        if url == self.website_url:
+            netloc = urlparse(final_url).netloc
+            if netloc not in self.base_domains:
+                self.base_domains += (netloc,)
+                self.mark_visited(urlnorm.canonicalize(final_url))
+
+    def seed_links(self, urls):
+        # Frontier entries for the same-site pages a sitemap or feed lists. They count as
+        # linked from the start page, so max_depth, include and exclude apply as usual.
+        links = []
+        for url in urls:
+            link = urlnorm.canonicalize(url)
+            parsed = urlparse(link)
+            if parsed.netloc in self.base_domains and parsed.scheme in ["http", "https"]:
+                links.append(link)
+        items = self.follow(links, 0)
+        self.count("seeded", len(items))
+        return items
+
+    def page_saved(self, url):
+        self.checkpoint.page_done(url)
+        with self.stats_lock:
+            self.run_stats["pages"] += 1
+            pages = self.run_stats["pages"]
+        if self.progress_callback is not None:
+            elapsed = time.time() - self.start_time
+            estimated = (elapsed / pages) * (len(self.visited) + 1)
+            self.progress_callback(pages, round(max(0, estimated - elapsed)))
+
+    def print_summary(self):
+        print(f"Asset cache: {self.asset_stats['hits']} hits, {self.asset_stats['misses']} misses")
+        print(f"Unchanged since last run: {self.run_stats['unchanged']}")
+        print(f"Duplicate assets not stored again: {self.run_stats['deduplicated']}")
+        print(f"Pages relinked to local copies: {self.run_stats['relinked']}")
+        print(f"Pages queued from sitemaps and feeds: {self.run_stats['seeded']}")
+
+    def stylesheet_refs(self, css_url, text, sha256):
+        # Parsed once per distinct stylesheet body; the same bytes served from several URLs
+        # share the scan and only resolve it against their own URL.
+        with self.css_cache_lock:
+            refs = self.css_cache.get(sha256)
+        if refs is None:
+            refs = css_rewrite.scan_css(text)
+            with self.css_cache_lock:
+                self.css_cache[sha256] = refs
+        return refs, [urljoin(css_url, value) for value, _, _ in refs]
+
+    def claim_object(self, local_path):
+        # True for the first download to produce local_path; later ones are duplicates.
+        with self.objects_lock:
+            if local_path in self.objects or self.writer.exists(local_path):
+                self.objects.add(local_path)
+                return False
+            self.objects.add(local_path)
+            return True
+
+    def store_download(self, asset_url, body, sha256, content_type):
+        # Puts a finished download into the object store. body is the downloaded bytes, or
+        # the path of a part file for assets too big to buffer. Returns (local_path,
+        # local_rel_path, stylesheet, saved): stylesheet is (text, refs, ref_urls) for CSS and
+        # None otherwise, saved a Future for the queued write or None if nothing was queued.
+        # A stylesheet's name also covers the URLs its references resolve to, since the same
+        # bytes served from two directories are rewritten to point at different files. Its
+        # buffered bytes aren't written here, only the rewritten version once its refs resolve.
+        buffered = isinstance(body, bytes)
+        stylesheet = None
+        key = sha256
+        if is_stylesheet(asset_url, content_type):
+            text = body.decode('utf-8', 'surrogateescape') if buffered else read_stylesheet(body)
+            refs, ref_urls = self.stylesheet_refs(asset_url, text, sha256)
+            stylesheet = (text, refs, ref_urls)
+            key = hashlib.sha256('\n'.join([sha256] + ref_urls).encode('utf-8')).hexdigest()
+        local_rel_path = asset_object_path(asset_url, key, content_type)
+        local_path = os.path.join(self.base_folder, local_rel_path)
+        saved = None
+        if not self.claim_object(local_path):
+            self.count("deduplicated")
+            if not buffered:
+                discard_part_file(body)
+        elif not buffered:
+            with self.metrics.timer("write"):
+                self.writer.store(local_path, body, asset_url)
+        elif stylesheet is None:
+            saved = self.writer.write(local_path, body, self.metrics, asset_url)
+        return local_path, local_rel_path, stylesheet, saved
+
+    def write_failed(self, path, error):
+        self.metrics.record_error(path, error)
+        self.log(f"Failed to write {path}: {error}")
+
+class CopyJob(JobState):
+    # The threaded engine for one site. Pages are handed out by a Scheduler, which also
+    # supplies the asset download pool and the optional parse pool.
+    def __init__(self, website_url, target_folder, order=CRAWL_ORDER, **options):
+        super().__init__(website_url, target_folder, **options)
+        # A FIFO frontier gives breadth-first order, a LIFO one keeps workers deep in the current branch.
+        self.lifo = order == "dfs"
+        self.frontier = deque()
+        self.active = 0
+        self.asset_pool = None
+        self.parse_pool = None
+        self.host_slots = {}
+        self.host_slots_lock = threading.Lock()
+        self.pending = 0
+        self.pending_cond = threading.Condition()
+        self.asset_cache = {}
+        self.asset_cache_lock = threading.Lock()
+        self.seeding = False
+
+    def queued(self):
+        return len(self.frontier)
+
+    def fetch_document(self, url):
+        # A sitemap or feed body, or None if there isn't one.
+        try:
+            with fetcher.fetch(url, stream=True) as response:
+                size = 0
+                chunks = []
+                if response.status_code == 200:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        size += len(chunk)
+                        chunks.append(chunk)
+                        if size > sitemap.MAX_DOCUMENT_SIZE:
+                            break
+                # Most of the probed paths don't exist on any given site; that isn't an error.
+                if response.status_code not in sitemap.MISSING_STATUSES:
+                    self.metrics.record_response(url, response.status_code, response.headers.get('Content-Type'),
+                                                 size)
+                self.count_bytes(size)
+                return b''.join(chunks) if response.status_code == 200 else None
+        except Exception as e:
+            self.metrics.record_error(url, e)
+            return None
+
+    def discover(self):
+        # Yields batches of frontier entries from the site's sitemaps and feeds.
+        discovery = sitemap.Discovery(self.website_url, sitemap.robots_sitemaps(self.website_url))
+        url = discovery.next_url()
+        while url is not None and self.wait_if_paused():
+            try:
+                items = self.seed_links(discovery.read(url, self.fetch_document(url)))
+            except Exception as e:
+                # One bad sitemap or feed doesn't end discovery for the rest.
+                self.log(f"Failed to read {url}: {e}")
+                items = []
+            if items:
+                self.log(f"Queued {len(items)} pages from {url}")
+                yield items
+            url = discovery.next_url()
+
+    def read_body(self, chunks, folder):
+        # Returns (body, sha256, size). body is the bytes themselves while they fit in
+        # BUFFERED_ASSET_SIZE; past that, what was buffered is spilled to a part file that
+        # the rest is streamed into, and body is its path.
+        buffered = []
+        f = part_path = None
+        try:
+            size = 0
+            digest = hashlib.sha256()
+            for chunk in chunks:
+                size += len(chunk)
+                check_size(size)
+                self.count_bytes(len(chunk))
+                digest.update(chunk)
+                if f is not None:
+                    f.write(chunk)
+                    continue
+                buffered.append(chunk)
+                if size > BUFFERED_ASSET_SIZE:
+                    f, part_path = open_part_file(folder)
+                    f.writelines(buffered)
+                    buffered = None
+            if f is None:
+                return b''.join(buffered), digest.hexdigest(), size
+            f.close()
+            return part_path, digest.hexdigest(), size
+        except BaseException:
+            if f is not None:
+                f.close()
+                discard_part_file(part_path)
+            raise
+
+    def process_stylesheet(self, asset_url, local_path, local_rel_path, stylesheet, record):
+        # Queues the stylesheet's fonts, images and imports through the normal asset path;
+        # the file is rewritten to point at them once they land, and record is stored again
+        # with where they went.
+        text, refs, ref_urls = stylesheet
+        futures = [self.fetch_asset(ref_url) for ref_url in ref_urls]
+
+        def done():
+            try:
+                if self.cancel_flag.is_set():
+                    self.track_done()
+                    return
+                local_paths = [f.result() for f in futures]
+                with self.metrics.timer("rewrite"):
+                    data = rewrite_stylesheet(local_rel_path, text, refs, local_paths)
+                saved = self.writer.write(local_path, data, self.metrics, asset_url)
+            except BaseException:
+                self.track_done()
+                raise
+            saved.add_done_callback(lambda saved: self.asset_written(saved, asset_url, record + (local_paths,)))
+
+        self.track_start()
+        when_all(futures, done)
+
+    def asset_written(self, saved, asset_url, record=None):
+        try:
+            if saved.exception() is not None:
+                self.write_failed(asset_url, saved.exception())
+                return
+            if record is not None:
+                self.meta_store.put(asset_url, "asset", *record)
+            self.checkpoint.asset_done(asset_url)
+        finally:
+            self.track_done()
+
+    def revalidate(self, asset_url, record):
+        # An unchanged stylesheet still points at where its references were saved last time.
+        # If one of them now resolves to another file (its bytes changed, or it failed then),
+        # the stylesheet is fetched in full again and rewritten under the same name.
+        futures = [self.fetch_asset(sub_url) for sub_url in record["assets"]]
+        if not futures:
+            return
+
+        def done():
+            try:
+                if not self.cancel_flag.is_set() and [f.result() for f in futures] != record["asset_paths"]:
+                    self.fetch_asset_body(asset_url, None)
+            finally:
+                self.track_done()
+
+        self.track_start()
+        when_all(futures, done)
+
+    def download_asset(self, asset_url):
+        record = self.meta_store.get(asset_url, "asset")
+        if asset_url in self.checkpoint.done_assets and self.meta_store.has_local_copy(record):
+            return record["local_path"]
+        with self.metrics.timer("asset"):
+            return self.fetch_asset_body(asset_url, record)
+
+    def fetch_asset_body(self, asset_url, record):
+        try:
+            headers = self.meta_store.conditional_headers(record)
+            with fetcher.fetch(asset_url, stream=True, headers=headers) as response:
+                self.metrics.observe("ttfb", response.elapsed.total_seconds())
+                content_type = response.headers.get('Content-Type', '')
+                if response.status_code != 200:
+                    self.metrics.record_response(asset_url, response.status_code, content_type, 0)
+                if response.status_code == 304 and headers:
+                    self.count("unchanged")
+                    self.checkpoint.asset_done(asset_url)
+                    self.revalidate(asset_url, record)
+                    return record["local_path"]
+                if response.status_code == 200:
+                    check_size(int(response.headers.get('Content-Length') or 0))
+                    folder = os.path.join(self.base_folder, get_asset_folder(urlparse(asset_url).path.lower()))
+                    body, sha256, size = self.read_body(response.iter_content(CHUNK_SIZE), folder)
+                    self.metrics.record_response(asset_url, 200, content_type, size)
+                    local_path, local_rel_path, stylesheet, saved = self.store_download(
+                        asset_url, body, sha256, content_type)
+                    record = (local_rel_path, response.headers, sha256, None, stylesheet[2] if stylesheet else None)
+                    if stylesheet:
+                        self.meta_store.put(asset_url, "asset", *record)
+                        self.process_stylesheet(asset_url, local_path, local_rel_path, stylesheet, record)
+                    elif saved is not None:
+                        # Recorded once the writer has it on disk, so a crash in between
+                        # means a fresh download rather than a missing file.
+                        self.track_start()
+                        saved.add_done_callback(lambda saved: self.asset_written(saved, asset_url, record))
+                    else:
+                        self.meta_store.put(asset_url, "asset", *record)
+                        self.checkpoint.asset_done(asset_url)
+                    return local_rel_path
+        except Exception as e:
+            self.metrics.record_error(asset_url, e)
+        return None
+
+    def wait_if_paused(self):
+        while self.pause_flag.is_set():
+            time.sleep(0.1)
+            if self.cancel_flag.is_set():
+                return False
+        return not self.cancel_flag.is_set()
+
+    def track_start(self):
+        with self.pending_cond:
+            self.pending += 1
+
+    def track_done(self):
+        with self.pending_cond:
+            self.pending -= 1
+            if self.pending == 0:
+                self.pending_cond.notify_all()
+
+    def wait_for_pending(self):
+        with self.pending_cond:
+            while self.pending:
+                self.pending_cond.wait()
+
+    def run_asset_job(self, host, asset_url, future):
+        try:
+            local_path = None
+            if self.wait_if_paused():
+                local_path = self.download_asset(asset_url)
+            future.set_result(local_path)
+        finally:
+            dropped = []
+            with self.host_slots_lock:
+                slot = self.host_slots[host]
+                if slot[1] and not self.cancel_flag.is_set():
+                    self.asset_pool.submit(self.run_asset_job, host, *slot[1].popleft())
+                else:
+                    dropped = list(slot[1])
+                    slot[1].clear()
+                    slot[0] -= 1
+            for _, waiting in dropped:
+                waiting.set_result(None)
+
+    def fetch_asset(self, asset_url):
+        # Returns a future for the asset's local path. Every URL is fetched once per run:
+        # later callers share the cached future, whether it has finished or is still in flight.
+        asset_url = urldefrag(asset_url)[0]
+        with self.asset_cache_lock:
+            future = self.asset_cache.get(asset_url)
+            if future is not None:
+                self.asset_stats["hits"] += 1
+                return future
+            future = self.asset_cache[asset_url] = Future()
+            self.asset_stats["misses"] += 1
+        self.submit_asset(asset_url, future)
+        return future
+
+    def submit_asset(self, asset_url, future):
+        # Queues asset_url on the shared download pool, holding it back while its host
+        # already has PER_HOST_ASSET_LIMIT downloads running for this job.
+        host = urlparse(asset_url).netloc
+        with self.host_slots_lock:
+            slot = self.host_slots.setdefault(host, [0, deque()])
+            if slot[0] >= PER_HOST_ASSET_LIMIT:
+                slot[1].append((asset_url, future))
+                return
+            slot[0] += 1
+        self.asset_pool.submit(self.run_asset_job, host, asset_url, future)
+
+    def reuse_page(self, url, record):
+        # The mirrored copy is current, so skip the parse and rewrite and only revalidate
+        # the assets it referenced last time.
+        self.count("unchanged")
+        futures = [self.fetch_asset(asset_url) for asset_url in record["assets"]]
+
+        def done():
+            try:
+                if self.cancel_flag.is_set():
+                    return
+                if [f.result() for f in futures] != record["asset_paths"]:
+                    # The copy on disk points at a file one of its assets was saved under
+                    # before (content-addressed names change with the bytes), so the page
+                    # is fetched in full and rewritten.
+                    self.copy_page(url, revalidate=False)
+                else:
+                    self.page_saved(url)
+            finally:
+                self.track_done()
+
+        self.track_start()
+        when_all(futures, done)
+        return record["links"]
+
+    def run_parse_step(self, fn, *args):
+        # Parsing and rewriting are pure CPU work, so with a parse pool they run in another
+        # process while this thread just waits, leaving the GIL to the network threads.
+        if self.parse_pool is None:
+            return fn(*args)
+        return self.parse_pool.submit(fn, *args).result()
+
+    def copy_page(self, url, revalidate=True):
+        # Fetches one page, hands its assets to the download pool and returns the same-site
+        # links found on it straight away. The page is rewritten and saved once its assets resolve.
+        record = self.meta_store.get(url, "page")
+        headers = self.meta_store.conditional_headers(record) if revalidate else {}
+        response = None
+        try:
+            with self.metrics.timer("fetch"):
+                response = fetcher.fetch(url, headers=headers)
+            self.page_fetched(url, response.url)
+            self.metrics.observe("ttfb", response.elapsed.total_seconds())
+            self.metrics.record_response(url, response.status_code, response.headers.get('Content-Type'),
+                                         len(response.content))
+            if response.status_code == 304 and headers:
+                return self.reuse_page(url, record)
+            response.raise_for_status()
+            self.count_bytes(len(response.content))
+            sha256 = hashlib.sha256(response.content).hexdigest()
+            if revalidate and self.meta_store.has_local_copy(record) and record["sha256"] == sha256:
+                return self.reuse_page(url, record)
+            text = response.text
+            with self.metrics.timer("parse"):
+                assets, asset_urls, links = self.run_parse_step(parse_page, response.url, text, self.base_domains)
+        except Exception as e:
+            # HTTP error statuses were already counted by record_response.
+            if response is None or response.ok:
+                self.metrics.record_error(url, e)
+            self.log(f"Failed to load {url}: {e}")
+            return []
+
+        futures = [self.fetch_asset(asset_url) for asset_url in asset_urls]
+
+        filename = sanitize_filename(urlparse(url).path)
+        html_path = os.path.join(self.base_folder, filename)
+
+        def save():
+            try:
+                # Canceled downloads resolve to None; leave the page for a resumed run instead
+                # of saving it with live asset URLs.
+                if self.cancel_flag.is_set():
+                    self.track_done()
+                    return
+                local_paths = [future.result() for future in futures]
+                replacements = []
+                for (_, _, start, end, quoted), local_asset_path in zip(assets, local_paths):
+                    if local_asset_path:
+                        replacements.append((start, end, quoted, local_asset_path))
+                with self.metrics.timer("rewrite"):
+                    page = self.run_parse_step(html_rewrite.rewrite, text, replacements)
+                saved = self.writer.write(html_path, page.encode('utf-8'), self.metrics, url)
+            except BaseException:
+                self.track_done()
+                raise
+            saved.add_done_callback(lambda saved: written(saved, local_paths))
+
+        def written(saved, local_paths):
+            try:
+                if saved.exception() is not None:
+                    self.write_failed(html_path, saved.exception())
+                    return
+                self.meta_store.put(url, "page", filename, response.headers, sha256, links, asset_urls,
+                                    local_paths)
+                self.log(f"Saved {url} -> {filename}")
+                self.page_saved(url)
+            finally:
+                self.track_done()
+
+        self.track_start()
+        when_all(futures, save)
+        return links
+
+    def process(self, url, depth):
+        # Copies one page and returns the new frontier entries it leads to.
+        if not self.wait_if_paused():
+            return []
+        return self.follow(self.copy_page(url), depth)
+
+class Scheduler:
+    # Runs any number of CopyJobs on one set of page workers, one asset download pool and
+    # the shared fetcher session. Workers take pages from the running jobs in turn, so a
+    # job with a huge frontier can't crowd out the rest; each job's assets are capped at
+    # PER_HOST_ASSET_LIMIT per host, so no job can fill the whole asset pool either.
+    # bandwidth (bytes per second) is one budget for every job's downloads together, and
+    # write_bandwidth the same for their writes through the shared writer stage.
+    def __init__(self, workers=MAX_WORKERS, max_jobs=None, bandwidth=None, parse_processes=PARSE_PROCESSES,
+                 pool_size=None, write_bandwidth=None):
+        self.workers = max(1, workers)
+        self.max_jobs = max_jobs
+        self.bandwidth = fetcher.Bandwidth(bandwidth) if bandwidth else None
+        self.parse_processes = parse_processes
+        self.pool_size = pool_size
+        self.write_bandwidth = write_bandwidth
+        self.cond = threading.Condition()
+        self.waiting = deque()
+        self.running = []
+        self.open_jobs = set()
+        self.finishers = []
+        self.turn = 0
+        self.stopped = False
+        self.asset_pool = None
+        self.parse_pool = None
+        self.writer = None
+
+    def admit(self):
+        while self.waiting and (self.max_jobs is None or len(self.open_jobs) < self.max_jobs):
+            job = self.waiting.popleft()
+            job.asset_pool = self.asset_pool
+            job.parse_pool = self.parse_pool
+            job.bandwidth = self.bandwidth
+            job.writer = self.writer
+            try:
+                items = job.open()
+            except Exception as e:
+                job.log(f"Failed to open {job.base_folder}: {e}")
+                continue
+            job.frontier.extend(items)
+            self.open_jobs.add(job)
+            self.running.append(job)
+            if job.sitemaps:
+                job.seeding = True
+                threading.Thread(target=self.seed_job, args=(job,), daemon=True).start()
+
+    def seed_job(self, job):
+        # Fills the job's frontier from its sitemaps and feeds alongside the crawl; the job
+        # isn't done until this is.
+        try:
+            for items in job.discover():
+                with self.cond:
+                    job.frontier.extend(items)
+                    self.cond.notify_all()
+        except Exception as e:
+            job.log(f"Failed to read sitemaps: {e}")
+        finally:
+            with self.cond:
+                job.seeding = False
+                self.check_done(job)
+                self.cond.notify_all()
+
+    def next_page(self):
+        for job in [job for job in self.running if job.cancel_flag.is_set()]:
+            job.frontier.clear()
+            self.check_done(job)
+        for _ in range(len(self.running)):
+            self.turn = (self.turn + 1) % len(self.running)
+            job = self.running[self.turn]
+            if job.frontier and not job.pause_flag.is_set():
+                job.active += 1
+                url, depth = job.frontier.pop() if job.lifo else job.frontier.popleft()
+                return job, url, depth
+        return None
+
+    def check_done(self, job):
+        # A job whose frontier has drained leaves the rotation; its deferred page and
+        # stylesheet saves finish on their own thread before the job is closed.
+        if job in self.running and not job.frontier and not job.active and not job.seeding:
+            self.running.remove(job)
+            finisher = threading.Thread(target=self.finish_job, args=(job,), daemon=True)
+            self.finishers.append(finisher)
+            finisher.start()
+
+    def finish_job(self, job):
+        try:
+            job.wait_for_pending()
+            job.close()
+        finally:
+            with self.cond:
+                self.open_jobs.discard(job)
+                self.admit()
+                self.cond.notify_all()
+
+    def worker(self):
+        while True:
+            with self.cond:
+                item = self.next_page()
+                while item is None:
+                    if self.stopped:
+                        return
+                    # Timed so paused jobs are picked up again when they resume.
+                    self.cond.wait(0.1)
+                    item = self.next_page()
+            job, url, depth = item
+            items = []
+            try:
+                items = job.process(url, depth)
+            finally:
+                with self.cond:
+                    job.active -= 1
+                    job.frontier.extend(items)
+                    self.check_done(job)
+                    self.cond.notify_all()
+
+    def checkpoint_loop(self, stop):
+        while not stop.wait(CHECKPOINT_INTERVAL):
+            with self.cond:
+                jobs = list(self.open_jobs)
+            for job in jobs:
+                job.flush_checkpoint()
+
+    def run(self, jobs):
+        # Blocks until every job has finished or been canceled.
+        if self.pool_size:
+            fetcher.configure(self.pool_size)
+        fetcher.reset_policies()
+        self.asset_pool = ThreadPoolExecutor(max_workers=ASSET_WORKERS)
+        self.parse_pool = open_parse_pool(self.parse_processes)
+        self.writer = writer.Writer(bandwidth=self.write_bandwidth)
+        stop_checkpoints = threading.Event()
+        checkpointer = threading.Thread(target=self.checkpoint_loop, args=(stop_checkpoints,), daemon=True)
+        checkpointer.start()
+        try:
+            with self.cond:
+                self.stopped = False
+                self.waiting.extend(jobs)
+                self.admit()
+            threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.workers)]
+            for t in threads:
+                t.start()
+            with self.cond:
+                while self.waiting or self.open_jobs:
+                    self.cond.wait()
+                self.stopped = True
+                self.cond.notify_all()
+            for t in threads:
+                t.join()
+            for finisher in self.finishers:
+                finisher.join()
+        finally:
+            self.asset_pool.shutdown(wait=True)
+            if self.parse_pool is not None:
+                self.parse_pool.shutdown(wait=True)
+                self.parse_pool = None
+            self.writer.close()
+            stop_checkpoints.set()
+            checkpointer.join()
+
+def progress_snapshot():
+    job = current_job
+    if job is None:
+        return {"pages": run_stats["pages"], "bytes": run_stats["bytes"], "seen": 0, "queued": 0}
+    return job.progress_snapshot()
+
+def start_copy(website_url, target_folder, progress_callback, finish_callback,
+               workers=MAX_WORKERS, max_depth=MAX_DEPTH, order=CRAWL_ORDER, pool_size=None, resume=True,
+               parse_processes=PARSE_PROCESSES, visited_index=VISITED_INDEX, log_callback=None,
+               include=None, exclude=None):
+    global current_job
+    cancel_flag.clear()
+    job = CopyJob(website_url, target_folder, order=order, max_depth=max_depth, resume=resume,
+                  visited_index=visited_index, include=include, exclude=exclude,
+                  progress_callback=progress_callback, log_callback=log_callback,
+                  pause_flag=pause_flag, cancel_flag=cancel_flag)
+    current_job = job
+    try:
+        Scheduler(workers, parse_processes=parse_processes, pool_size=pool_size).run([job])
+    finally:
+        asset_stats.update(job.asset_stats)
+        run_stats.update(job.run_stats)
+        current_job = None
+    job.print_summary()
+
+    finish_callback()
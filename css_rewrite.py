@@ -0,0 +1,63 @@
+import posixpath
+import re
+
+# Comments are matched first so url()/@import inside them are skipped.
+CSS_REF_RE = re.compile(
+    r'/\*.*?\*/'
+    r'|url\(\s*(?:"([^"]*)"|\'([^\']*)\'|([^)"\'\s]*))\s*\)'
+    r'|@import\s+(?:"([^"]*)"|\'([^\']*)\')',
+    re.S | re.I)
+
+def is_local_ref(value):
+    return not value or value.startswith(("#", "data:", "about:", "javascript:"))
+
+def scan_css(text, offset=0):
+    # Returns (url, start, end) for every url() and @import string in text, with the span
+    # of the bare URL so it can be swapped without touching the surrounding quotes.
+    refs = []
+    for match in CSS_REF_RE.finditer(text):
+        for group in range(1, 6):
+            value = match.group(group)
+            if value is not None:
+                if not is_local_ref(value.strip()):
+                    start, end = match.span(group)
+                    refs.append((value.strip(), offset + start, offset + end))
+                break
+    return refs
+
+def srcset_candidates(value, offset=0):
+    # Splits an srcset attribute into (url, start, end) per candidate. A URL is a run of
+    # non-space characters; trailing commas end the candidate, anything after the URL up
+    # to the next comma is a width/density descriptor.
+    candidates = []
+    pos = 0
+    size = len(value)
+    while pos < size:
+        while pos < size and (value[pos].isspace() or value[pos] == ","):
+            pos += 1
+        start = pos
+        while pos < size and not value[pos].isspace():
+            pos += 1
+        end = pos
+        while end > start and value[end - 1] == ",":
+            end -= 1
+        if end > start:
+            candidates.append((value[start:end], offset + start, offset + end))
+        if end == pos:
+            while pos < size and value[pos] != ",":
+                pos += 1
+    return candidates
+
+def relative_path(target, from_file):
+    # Both paths are relative to the mirror root; the result is how from_file refers to target.
+    return posixpath.relpath(target, posixpath.dirname(from_file) or ".")
+
+def rewrite(text, replacements):
+    parts = []
+    pos = 0
+    for start, end, value in sorted(replacements):
+        parts.append(text[pos:start])
+        parts.append(value)
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
@@ -0,0 +1,424 @@
+import socket
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError
+from urllib3.util.retry import Retry
+
+TIMEOUT = 10
+POOL_HOSTS = 32
+POOL_SIZE_PER_HOST = 16
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (500, 502, 504)
+USER_AGENT = "website-copier"
+RESPECT_ROBOTS = True
+# Requests per second per host. None puts no cap on a host until it pushes back with a
+# 429/503; a number (or a robots.txt Crawl-delay) is a ceiling the rate never goes over.
+HOST_RATE = None
+HOST_BURST = 8
+THROTTLE_STATUSES = (429, 503)
+# A host runs uncapped until it first pushes back, so requests caught in that first burst get
+# more tries than RETRIES, backing off exponentially, while the rate comes down.
+THROTTLE_RETRIES = 8
+# Additive increase, multiplicative decrease: a throttle halves the rate (once per
+# DECREASE_INTERVAL, so a burst of them from requests already in flight counts once), and
+# successes add RATE_INCREASE requests per second back for every second at full rate.
+RATE_DECREASE = 0.5
+DECREASE_INTERVAL = 0.25
+RATE_INCREASE = 1.0
+MIN_RATE = 0.1
+# Recent request times, for the rate an uncapped host was running at when it first pushed back.
+RATE_WINDOW = 64
+MAX_RETRY_AFTER = 300
+# "requests" (HTTP/1.1, one connection per in-flight request) or "httpx" (HTTP/2 where the
+# server offers it over TLS, so every request to a host shares one multiplexed connection).
+TRANSPORT = "requests"
+# None sends whatever the transport can decode (gzip and deflate, plus br and zstd when their
+# decoders are installed); set it to pin the encodings, e.g. "identity" for raw bodies.
+ACCEPT_ENCODING = None
+
+session = None
+session_lock = threading.Lock()
+host_policies = {}
+host_policies_lock = threading.Lock()
+# A DnsCache the copier's own connections resolve through (enable_dns_cache); None leaves
+# every lookup to the system resolver.
+dns_cache = None
+
+class RobotsDisallowed(requests.RequestException):
+    pass
+
+class HostPolicy:
+    # Token bucket for one host, AIMD-controlled. Without a cap (HOST_RATE, Crawl-delay) the
+    # bucket is open until the first 429/503, which sets the rate to half what the host was
+    # getting. After that, throttles halve it again and successes raise it step by step.
+    # A Retry-After header closes the bucket until it expires.
+    def __init__(self, robots):
+        self.lock = threading.Lock()
+        self.robots = robots
+        delay = robots.crawl_delay(USER_AGENT) if robots else None
+        self.limit = 1.0 / float(delay) if delay else HOST_RATE
+        self.rate = self.limit
+        self.burst = 1 if delay else HOST_BURST
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.decreased = 0.0
+        self.recent = deque(maxlen=RATE_WINDOW)
+
+    def allowed(self, url):
+        return not RESPECT_ROBOTS or self.robots is None or self.robots.can_fetch(USER_AGENT, url)
+
+    def reserve(self):
+        # Takes a token and returns 0, or returns how long to wait before asking again.
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.rate is None:
+                self.recent.append(now)
+                return 0
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        while wait:
+            time.sleep(wait)
+            wait = self.reserve()
+
+    def measured_rate(self):
+        if len(self.recent) < 2 or self.recent[-1] <= self.recent[0]:
+            return float(self.burst)
+        return (len(self.recent) - 1) / (self.recent[-1] - self.recent[0])
+
+    def record(self, status, retry_after=None):
+        with self.lock:
+            now = time.monotonic()
+            if status in THROTTLE_STATUSES:
+                if now - self.decreased >= DECREASE_INTERVAL:
+                    rate = self.measured_rate() if self.rate is None else self.rate
+                    self.rate = max(MIN_RATE, rate * RATE_DECREASE)
+                    self.decreased = now
+                delay = parse_retry_after(retry_after)
+                if delay is None:
+                    delay = 1.0 / self.rate
+                self.blocked_until = max(self.blocked_until, now + delay)
+                self.tokens = 0
+                self.updated = now
+            elif self.rate is not None and (self.limit is None or self.rate < self.limit):
+                self.rate += RATE_INCREASE / self.rate
+                if self.limit is not None:
+                    self.rate = min(self.limit, self.rate)
+
+class Bandwidth:
+    # Byte budget shared by every download that reports to it. The bucket is allowed to go
+    # into debt, and whoever takes it there sleeps the debt off, so the long-run rate holds
+    # no matter how many threads are reading.
+    def __init__(self, rate):
+        self.lock = threading.Lock()
+        self.rate = float(rate)
+        self.tokens = self.rate
+        self.updated = time.monotonic()
+
+    def consume(self, size):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= size
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class HttpxResponse:
+    # The part of requests.Response the engines use, over a streamed httpx response.
+    def __init__(self, response, elapsed):
+        self.response = response
+        self.status_code = response.status_code
+        self.reason = response.reason_phrase
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def content(self):
+        try:
+            return self.response.read()
+        finally:
+            self.response.close()
+
+    @property
+    def text(self):
+        self.content
+        return self.response.text
+
+    def iter_content(self, chunk_size):
+        return self.response.iter_bytes(chunk_size)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error: {self.reason} for url: {self.url}", response=self)
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class HttpxSession:
+    # Stands in for requests.Session when TRANSPORT is "httpx". Connection failures and
+    # RETRY_STATUSES are retried like the requests session's urllib3 Retry, and httpx errors
+    # come out as their requests equivalents so callers only deal with one family.
+    def __init__(self, pool_size=POOL_SIZE_PER_HOST):
+        try:
+            import httpcore
+            import httpx
+            transport = httpx.HTTPTransport(http2=True, retries=RETRIES,
+                                            limits=httpx.Limits(max_connections=POOL_HOSTS * pool_size))
+        except ImportError:
+            raise RuntimeError("The httpx transport needs httpx with HTTP/2 support (pip install 'httpx[http2]')") \
+                from None
+        self.httpx = httpx
+        headers = {"User-Agent": USER_AGENT}
+        if ACCEPT_ENCODING:
+            headers["Accept-Encoding"] = ACCEPT_ENCODING
+        # httpx has no resolver setting; its connection pool opens sockets through this backend.
+        pool = transport._pool
+        pool._network_backend = CachedDnsBackend(pool._network_backend, httpcore.ConnectError, httpcore.ConnectTimeout)
+        self.client = httpx.Client(transport=transport, headers=headers, follow_redirects=True)
+
+    def get(self, url, timeout=TIMEOUT, stream=False, headers=None):
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                request = self.client.build_request("GET", url, headers=headers, timeout=timeout)
+                response = self.client.send(request, stream=True)
+            except self.httpx.TimeoutException as e:
+                raise requests.Timeout(str(e)) from e
+            except self.httpx.TransportError as e:
+                raise requests.ConnectionError(str(e)) from e
+            if response.status_code in RETRY_STATUSES and attempt < RETRIES:
+                response.close()
+                time.sleep(BACKOFF_FACTOR * 2 ** attempt)
+                attempt += 1
+                continue
+            # Time to headers, the same thing requests reports as elapsed.
+            wrapped = HttpxResponse(response, timedelta(seconds=time.perf_counter() - started))
+            if not stream:
+                wrapped.content
+            return wrapped
+
+    def close(self):
+        self.client.close()
+
+class DnsCache:
+    # getaddrinfo answers kept ttl seconds, for the copier's own connections only: the
+    # requests session's connection classes and the httpx backend ask it instead of the system.
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.next_prune = time.monotonic() + ttl
+
+    def addresses(self, host, port):
+        key = (host, port)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self.lock:
+            # Once a ttl, drop what has expired; hosts not asked for again would stay forever.
+            if now >= self.next_prune:
+                self.entries = {key: entry for key, entry in self.entries.items() if entry[0] > now}
+                self.next_prune = now + self.ttl
+            self.entries[key] = (now + self.ttl, addresses)
+        return addresses
+
+class CachedDnsConnectionMixin:
+    # urllib3 opens the socket to _dns_host but sends Host and checks the certificate against
+    # host, so pointing _dns_host at each cached address in turn only changes where it connects.
+    def _new_conn(self):
+        cache = dns_cache
+        if cache is None:
+            return super()._new_conn()
+        host = self._dns_host
+        try:
+            addresses = cache.addresses(host, self.port)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        error = None
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except ConnectTimeoutError as e:
+                    error = e
+        finally:
+            self._dns_host = host
+        raise error
+
+class CachedDnsHTTPConnection(CachedDnsConnectionMixin, HTTPConnection):
+    pass
+
+class CachedDnsHTTPSConnection(CachedDnsConnectionMixin, HTTPSConnection):
+    pass
+
+class CachedDnsHTTPPool(HTTPConnectionPool):
+    ConnectionCls = CachedDnsHTTPConnection
+
+class CachedDnsHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = CachedDnsHTTPSConnection
+
+class CachedDnsAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": CachedDnsHTTPPool, "https": CachedDnsHTTPSPool}
+
+class CachedDnsBackend:
+    # Wraps httpcore's network backend the same way; TLS still uses the request's host name.
+    def __init__(self, backend, *errors):
+        self.backend = backend
+        self.errors = errors
+
+    def connect_tcp(self, host, port, **kwargs):
+        cache = dns_cache
+        if cache is None:
+            return self.backend.connect_tcp(host, port, **kwargs)
+        try:
+            addresses = cache.addresses(host, port)
+        except socket.gaierror as e:
+            raise self.errors[0](str(e)) from e
+        error = None
+        for address in addresses:
+            try:
+                return self.backend.connect_tcp(address, port, **kwargs)
+            except self.errors as e:
+                error = e
+        raise error
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+def enable_dns_cache(ttl):
+    # A fresh cache, so connections already resolving keep the one they started with.
+    global dns_cache
+    dns_cache = DnsCache(ttl) if ttl else None
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0), MAX_RETRY_AFTER)
+
+def load_robots(scheme, host):
+    robots = RobotFileParser()
+    try:
+        response = get_session().get(f"{scheme}://{host}/robots.txt", timeout=TIMEOUT)
+    except requests.RequestException:
+        return None
+    # Same rules as RobotFileParser.read: auth errors close the site, other 4xx open it.
+    if response.status_code in (401, 403):
+        robots.disallow_all = True
+    elif response.status_code >= 400:
+        robots.allow_all = True
+    else:
+        robots.parse(response.text.splitlines())
+    return robots
+
+def policy_for(url):
+    parsed = urlparse(url)
+    with host_policies_lock:
+        entry = host_policies.get(parsed.netloc)
+        if entry is None:
+            entry = host_policies[parsed.netloc] = [threading.Lock(), None]
+    # robots.txt is fetched once per host; other threads for the host wait on its lock.
+    with entry[0]:
+        if entry[1] is None:
+            entry[1] = HostPolicy(load_robots(parsed.scheme, parsed.netloc) if RESPECT_ROBOTS else None)
+        return entry[1]
+
+def make_session(pool_size=POOL_SIZE_PER_HOST):
+    # 429/503 and Retry-After are left to the host policy in fetch(), which slows the whole
+    # host down rather than just retrying the one request.
+    if TRANSPORT == "httpx":
+        return HttpxSession(pool_size)
+    retry = Retry(total=RETRIES, backoff_factor=BACKOFF_FACTOR, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=frozenset(["GET", "HEAD"]), raise_on_status=False,
+                  respect_retry_after_header=False)
+    # pool_block keeps each host at pool_size open connections instead of opening
+    # throwaway ones once the pool is exhausted.
+    adapter = CachedDnsAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_size,
+                               max_retries=retry, pool_block=True)
+    s = requests.Session()
+    s.headers["User-Agent"] = USER_AGENT
+    if ACCEPT_ENCODING:
+        s.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+def get_session():
+    global session
+    with session_lock:
+        if session is None:
+            session = make_session()
+        return session
+
+def configure(pool_size=POOL_SIZE_PER_HOST):
+    global session
+    with session_lock:
+        old, session = session, make_session(pool_size)
+    if old is not None:
+        old.close()
+
+def reset_policies():
+    with host_policies_lock:
+        host_policies.clear()
+
+def fetch(url, **kwargs):
+    kwargs.setdefault("timeout", TIMEOUT)
+    policy = policy_for(url)
+    if not policy.allowed(url):
+        raise RobotsDisallowed(f"robots.txt disallows {url}")
+    attempt = 0
+    while True:
+        policy.acquire()
+        response = get_session().get(url, **kwargs)
+        policy.record(response.status_code, response.headers.get("Retry-After"))
+        if response.status_code not in THROTTLE_STATUSES or attempt >= THROTTLE_RETRIES:
+            return response
+        response.close()
+        time.sleep(BACKOFF_FACTOR * 2 ** attempt)
+        attempt += 1
@@ -0,0 +1,91 @@
+import html
+import re
+import css_rewrite
+
+# One left-to-right pass over the raw markup: comments are skipped, script/style bodies
+# are jumped over, and only the start tags we care about have their attributes read.
+# A quote only opens a quoted value right after "="; anywhere else, as in title=O'Reilly,
+# it is an ordinary character and unquoted values run to whitespace or ">".
+TAG_RE = re.compile(r'<!--.*?-->|<([a-zA-Z][^\s/>]*)((?:[^>=]|=\s*(?:"[^"]*"|\'[^\']*\'|(?![\s"\'])))*)>', re.S)
+TAG_START_RE = re.compile(r'<(?:!--|[a-zA-Z])')
+ATTR_RE = re.compile(r'([^\s=/>"\']+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+RAW_TEXT_TAGS = ("script", "style")
+# Searched on the text itself: lowercasing a copy isn't length-preserving ("İ" becomes two
+# characters), so offsets found in it drift.
+RAW_TEXT_CLOSE = {name: re.compile("</" + name, re.I | re.A) for name in RAW_TEXT_TAGS}
+ASSET_ATTRS = {"img": "src", "script": "src", "link": "href", "source": "src"}
+SRCSET_TAGS = ("img", "source")
+
+def tag_attrs(match):
+    offset = match.start(2)
+    for attr in ATTR_RE.finditer(match.group(2)):
+        for group in (2, 3, 4):
+            if attr.group(group) is not None:
+                start, end = attr.span(group)
+                quoted = group != 4
+                yield attr.group(1).lower(), attr.group(group), offset + start, offset + end, quoted
+                break
+        else:
+            yield attr.group(1).lower(), None, None, None, False
+
+def scan(text):
+    # Returns (assets, anchors). Assets are (kind, url, start, end, quoted) with the
+    # character span of the URL so it can be replaced in place later: one entry per
+    # img/script/source src and link href, per srcset candidate, and per url()/@import
+    # in <style> blocks and style attributes. Anchors are (url, start, end, quoted) for
+    # every <a href>.
+    assets = []
+    anchors = []
+    pos = 0
+    while True:
+        start = TAG_START_RE.search(text, pos)
+        if start is None:
+            break
+        match = TAG_RE.match(text, start.start())
+        if match is None:
+            # The tag or comment never closes (no ">", or a quoted value with no closing
+            # quote), so like a browser take it to run to the end. Retrying from the next
+            # "<" would rescan the rest of the document once for every "<" in it.
+            break
+        pos = match.end()
+        name = match.group(1)
+        if name is None:
+            continue
+        name = name.lower()
+        wanted = "href" if name == "a" else ASSET_ATTRS.get(name)
+        for attr, value, start, end, quoted in tag_attrs(match):
+            if value is None:
+                continue
+            if attr == wanted:
+                value = html.unescape(value).strip()
+                if name == "a":
+                    anchors.append((value, start, end, quoted))
+                elif value:
+                    assets.append((name, value, start, end, quoted))
+            elif attr == "srcset" and name in SRCSET_TAGS:
+                for url, url_start, url_end in css_rewrite.srcset_candidates(value, start):
+                    assets.append(("srcset", html.unescape(url), url_start, url_end, True))
+            elif attr == "style":
+                for url, url_start, url_end in css_rewrite.scan_css(value, start):
+                    assets.append(("style", html.unescape(url), url_start, url_end, True))
+        if name in RAW_TEXT_TAGS:
+            close = RAW_TEXT_CLOSE[name].search(text, pos)
+            body_end = len(text) if close is None else close.start()
+            if name == "style":
+                for url, url_start, url_end in css_rewrite.scan_css(text[pos:body_end], pos):
+                    assets.append(("style", url, url_start, url_end, True))
+            pos = body_end
+    return assets, anchors
+
+def rewrite(text, replacements):
+    # replacements: (start, end, quoted, new_value) spans taken from scan(); everything
+    # outside them is copied through untouched.
+    parts = []
+    pos = 0
+    for start, end, quoted, value in sorted(replacements):
+        value = html.escape(value, quote=True)
+        parts.append(text[pos:start])
+        parts.append(value if quoted else '"' + value + '"')
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
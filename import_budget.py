@@ -0,0 +1,70 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Startup import budget for the GUI: python import_budget.py [--budget-ms 75] [--top 15] [--json]
+# Imports testv5 in a fresh interpreter under -X importtime, a few times over, and fails when
+# the median import time goes over budget or when a module that is meant to load in the
+# background (the networking and parsing stacks) shows up before the window does.
+
+MODULES = ["testv5"]
+IMPORT_BUDGET_MS = 75
+REPEAT = 5
+# Loaded by testv5.load_engines after the window is shown; importing any of them at the top
+# of testv5 puts seconds back on the packaged app's cold start.
+DEFERRED = ["copier", "async_copier", "fetcher", "requests", "urllib3", "aiohttp", "bs4"]
+
+def measure(modules):
+    # Returns {module: (self_us, cumulative_us, depth)} for one run, in import order.
+    code = "; ".join(f"import {name}" for name in modules) or "pass"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, check=True)
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        timings[name.strip()] = (int(own), int(cumulative), depth)
+    return timings
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Check the GUI's startup imports against a time budget.")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Whatever the bare interpreter imports (site, encodings, .pth hooks) isn't the app's doing
+    # and doesn't happen the same way in the frozen executable, so it is left out.
+    startup = set(measure([]))
+    runs = [{name: timing for name, timing in measure(args.modules).items() if name not in startup}
+            for _ in range(max(1, args.repeat))]
+    totals = [sum(cumulative for _, cumulative, depth in run.values() if depth == 0) / 1000 for run in runs]
+    total_ms = statistics.median(totals)
+    last = runs[-1]
+    slowest = sorted(last.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    deferred = [name for name in DEFERRED if name in last]
+    ok = total_ms <= args.budget_ms and not deferred
+    if args.json:
+        print(json.dumps({"modules": args.modules, "total_ms": round(total_ms, 1), "runs_ms": [round(t, 1) for t in totals],
+                          "budget_ms": args.budget_ms, "deferred_imported": deferred, "ok": ok,
+                          "slowest": [{"module": name, "self_ms": own / 1000, "cumulative_ms": cumulative / 1000}
+                                      for name, (own, cumulative, _) in slowest]}, indent=2))
+    else:
+        for name, (own, cumulative, depth) in slowest:
+            print(f"{cumulative / 1000:8.1f} ms {own / 1000:8.1f} ms  {'  ' * depth}{name}")
+        print(f"import {', '.join(args.modules)}: {total_ms:.1f} ms (median of {len(totals)}), "
+              f"budget {args.budget_ms:g} ms")
+        if deferred:
+            print(f"imported at startup but meant to load in the background: {', '.join(deferred)}")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
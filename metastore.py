@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import threading
+
+STATE_DIR = ".copier"
+FIELDS = ("kind", "local_path", "etag", "last_modified", "sha256", "links", "assets", "asset_paths")
+
+class MetaStore:
+    # Per-target-folder record of every page and asset fetched, kept in
+    # <target>/.copier/state.sqlite so later runs can send conditional requests.
+    def __init__(self, base_folder, exists=os.path.exists):
+        self.base_folder = base_folder
+        self.exists = exists
+        state_dir = os.path.join(base_folder, STATE_DIR)
+        os.makedirs(state_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(state_dir, "state.sqlite"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS resources (
+            url TEXT, kind TEXT, local_path TEXT, etag TEXT,
+            last_modified TEXT, sha256 TEXT, links TEXT, assets TEXT, asset_paths TEXT, PRIMARY KEY (kind, url))""")
+        # Where each of a page's or stylesheet's assets was saved, in the same order as assets;
+        # added after the table, so older state databases get the column here.
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(resources)")]
+        if "asset_paths" not in columns:
+            self.db.execute("ALTER TABLE resources ADD COLUMN asset_paths TEXT")
+        # For every saved page, the link targets its <a href>s were last pointed at locally.
+        self.db.execute("CREATE TABLE IF NOT EXISTS relinked (url TEXT PRIMARY KEY, targets TEXT)")
+        self.db.commit()
+
+    def get(self, url, kind):
+        with self.lock:
+            row = self.db.execute("SELECT " + ", ".join(FIELDS) + " FROM resources WHERE kind = ? AND url = ?",
+                                  (kind, url)).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(FIELDS, row))
+        record["links"] = json.loads(record["links"] or "[]")
+        record["assets"] = json.loads(record["assets"] or "[]")
+        # None when they weren't recorded, which never matches what the assets resolve to now.
+        record["asset_paths"] = json.loads(record["asset_paths"]) if record["asset_paths"] else None
+        return record
+
+    def put(self, url, kind, local_path, response_headers, sha256, links=None, assets=None, asset_paths=None):
+        values = (url, kind, local_path, response_headers.get("ETag"), response_headers.get("Last-Modified"),
+                  sha256, json.dumps(links or []), json.dumps(assets or []),
+                  None if asset_paths is None else json.dumps(list(asset_paths)))
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", values)
+            if kind == "page":
+                # A freshly saved page has live links again.
+                self.db.execute("DELETE FROM relinked WHERE url = ?", (url,))
+            self.db.commit()
+
+    def pages(self):
+        # (url, local_path, links) for every saved page: the URL -> local file index.
+        with self.lock:
+            rows = self.db.execute("SELECT url, local_path, links FROM resources WHERE kind = 'page'").fetchall()
+        return [(url, local_path, json.loads(links or "[]")) for url, local_path, links in rows]
+
+    def relinked_targets(self):
+        with self.lock:
+            rows = self.db.execute("SELECT url, targets FROM relinked").fetchall()
+        return {url: json.loads(targets) for url, targets in rows}
+
+    def set_relinked(self, items):
+        # items: (page url, sorted target urls) pairs, stored in one transaction.
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO relinked VALUES (?, ?)",
+                                [(url, json.dumps(targets)) for url, targets in items])
+            self.db.commit()
+
+    def has_local_copy(self, record):
+        return bool(record and record["local_path"]
+                    and self.exists(os.path.join(self.base_folder, record["local_path"])))
+
+    def conditional_headers(self, record):
+        # Only worth revalidating when the mirrored copy is still on disk.
+        if not self.has_local_copy(record):
+            return {}
+        headers = {}
+        if record["etag"]:
+            headers["If-None-Match"] = record["etag"]
+        if record["last_modified"]:
+            headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class Checkpoint:
+    # Crawl progress (queued and finished pages, finished assets) buffered in memory and
+    # flushed to the state database in one transaction at a time, so a crash, cancel or
+    # closed window loses at most the last CHECKPOINT_INTERVAL seconds of bookkeeping.
+    def __init__(self, store, website_url):
+        self.store = store
+        self.website_url = website_url
+        self.lock = threading.Lock()
+        self.queued = []
+        self.done = []
+        self.done_assets = set()
+        with store.lock:
+            store.db.execute("CREATE TABLE IF NOT EXISTS checkpoint_info (key TEXT PRIMARY KEY, value TEXT)")
+            store.db.execute("""CREATE TABLE IF NOT EXISTS checkpoint (
+                kind TEXT, url TEXT, depth INTEGER, done INTEGER, PRIMARY KEY (kind, url))""")
+            store.db.commit()
+
+    def load(self):
+        # Returns (visited page URLs, pending (url, depth) pairs) left by an unfinished
+        # crawl of the same site, or None when there is nothing to resume.
+        with self.store.lock:
+            row = self.store.db.execute("SELECT value FROM checkpoint_info WHERE key = 'website_url'").fetchone()
+            if row is None or row[0] != self.website_url:
+                return None
+            rows = self.store.db.execute("SELECT kind, url, depth, done FROM checkpoint ORDER BY rowid").fetchall()
+        visited = set()
+        pending = []
+        for kind, url, depth, done in rows:
+            if kind == "asset":
+                self.done_assets.add(url)
+                continue
+            visited.add(url)
+            if not done:
+                pending.append((url, depth))
+        return visited, pending
+
+    def start(self):
+        with self.store.lock:
+            self.store.db.execute("DELETE FROM checkpoint")
+            self.store.db.execute("INSERT OR REPLACE INTO checkpoint_info VALUES ('website_url', ?)",
+                                  (self.website_url,))
+            self.store.db.commit()
+
+    def page_queued(self, url, depth):
+        with self.lock:
+            self.queued.append(("page", url, depth, 0))
+
+    def page_done(self, url):
+        with self.lock:
+            self.done.append(("page", url))
+
+    def asset_done(self, url):
+        with self.lock:
+            self.queued.append(("asset", url, 0, 1))
+
+    def flush(self):
+        with self.lock:
+            queued, self.queued = self.queued, []
+            done, self.done = self.done, []
+        if not queued and not done:
+            return
+        with self.store.lock:
+            with self.store.db:
+                self.store.db.executemany("INSERT OR IGNORE INTO checkpoint VALUES (?, ?, ?, ?)", queued)
+                self.store.db.executemany("UPDATE checkpoint SET done = 1 WHERE kind = ? AND url = ?", done)
+
+    def finish(self):
+        with self.lock:
+            self.queued, self.done = [], []
+        with self.store.lock:
+            with self.store.db:
+                self.store.db.execute("DELETE FROM checkpoint")
+                self.store.db.execute("DELETE FROM checkpoint_info")
@@ -0,0 +1,154 @@
+import csv
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# fetch: request until the body is read; ttfb: until the headers arrive; dns/connect: new
+# connections (asyncio engine only, requests doesn't expose them); asset: one whole asset
+# download; parse, rewrite and write: the page and stylesheet CPU and disk steps; relink:
+# the pass pointing saved pages' links at each other once the crawl is done.
+STAGES = ("fetch", "ttfb", "dns", "connect", "asset", "parse", "rewrite", "write", "relink")
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf)
+LIVE_INTERVAL = 2
+
+class Histogram:
+    # Fixed latency buckets in seconds; percentiles are read off as the bucket upper bound.
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return self.max if bound == math.inf else bound
+        return self.max
+
+    def as_dict(self):
+        return {"count": self.count, "total": round(self.total, 6),
+                "mean": round(self.total / self.count, 6) if self.count else 0.0,
+                "max": round(self.max, 6), "p50": self.percentile(0.5), "p90": self.percentile(0.9),
+                "p99": self.percentile(0.99),
+                "buckets": {("inf" if bound == math.inf else str(bound)): n for bound, n in zip(BUCKETS, self.counts)}}
+
+def content_kind(content_type):
+    return (content_type or "").split(";")[0].strip().lower() or "unknown"
+
+class Metrics:
+    # Per-job timings and counters. Everything is updated under one lock; the work being
+    # timed is network and disk bound, so contention doesn't show.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.hosts = {}
+        self.types = {}
+        self.errors = {}
+        self.started = time.time()
+        self.live_stop = None
+        self.live_thread = None
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.stages[stage].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def record_response(self, url, status, content_type, size):
+        host = urlparse(url).netloc
+        kind = content_kind(content_type)
+        failed = status >= 400
+        with self.lock:
+            by_host = self.hosts.setdefault(host, {"requests": 0, "bytes": 0, "errors": 0})
+            by_type = self.types.setdefault(kind, {"responses": 0, "bytes": 0, "errors": 0})
+            by_host["requests"] += 1
+            by_host["bytes"] += size
+            by_type["responses"] += 1
+            by_type["bytes"] += size
+            if failed:
+                by_host["errors"] += 1
+                by_type["errors"] += 1
+                self.errors[f"HTTP {status}"] = self.errors.get(f"HTTP {status}", 0) + 1
+
+    def record_error(self, url, error):
+        host = urlparse(url).netloc
+        kind = type(error).__name__
+        with self.lock:
+            by_host = self.hosts.setdefault(host, {"requests": 0, "bytes": 0, "errors": 0})
+            by_host["errors"] += 1
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return {"elapsed": round(time.time() - self.started, 3),
+                    "stages": {stage: h.as_dict() for stage, h in self.stages.items()},
+                    "hosts": {host: dict(c) for host, c in self.hosts.items()},
+                    "content_types": {kind: dict(c) for kind, c in self.types.items()},
+                    "errors": dict(self.errors)}
+
+    def write_json(self, path, extra=None):
+        report = self.snapshot()
+        if extra:
+            report.update(extra)
+        part_path = path + ".part"
+        with open(part_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        os.replace(part_path, path)
+
+    def write_csv(self, path):
+        # One row per number: section,key,metric,value, e.g. "stage,fetch,p90,0.25".
+        report = self.snapshot()
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(("section", "key", "metric", "value"))
+            for stage, h in report["stages"].items():
+                for metric in ("count", "total", "mean", "max", "p50", "p90", "p99"):
+                    writer.writerow(("stage", stage, metric, h[metric]))
+            for section, name in (("hosts", "host"), ("content_types", "content_type")):
+                for key, counters in sorted(report[section].items()):
+                    for metric, value in counters.items():
+                        writer.writerow((name, key, metric, value))
+            for kind, n in sorted(report["errors"].items()):
+                writer.writerow(("error", kind, "count", n))
+
+    def start_live(self, path, extra=None, interval=LIVE_INTERVAL):
+        # Rewrites path every interval seconds so a dashboard or `watch cat` can follow the run.
+        # extra is called for additional top-level fields, e.g. the job's progress.
+        self.live_stop = threading.Event()
+
+        def loop():
+            while not self.live_stop.wait(interval):
+                self.write_json(path, extra() if extra else None)
+
+        self.live_thread = threading.Thread(target=loop, daemon=True)
+        self.live_thread.start()
+
+    def stop_live(self):
+        if self.live_thread is not None:
+            self.live_stop.set()
+            self.live_thread.join()
+            self.live_thread = None
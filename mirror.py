@@ -0,0 +1,191 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+import archive
+import copier
+import fetcher
+
+# Headless entry point: python mirror.py https://example.com ./out --depth 3 --exclude "*/tag/*"
+# or, for many sites at once, python mirror.py --batch sites.txt ./out --workers 32 --jobs 8.
+# Nothing here touches tkinter, so it runs on servers without a display.
+
+ENGINES = ("threads", "asyncio")
+
+def make_job(website_url, target_folder, engine="threads", workers=None, **options):
+    # options are the JobState keywords: max_depth, resume, visited_index, include, exclude,
+    # order, progress_callback, log_callback, pause_flag, cancel_flag, live_metrics, archive_format,
+    # relink, sitemaps.
+    if engine == "asyncio":
+        import async_copier
+        if workers:
+            options["tasks"] = workers
+        return async_copier.AsyncCrawl(website_url, target_folder, **options)
+    if engine == "threads":
+        return copier.CopyJob(website_url, target_folder, **options)
+    raise ValueError(f"unknown engine {engine!r}")
+
+def report(job):
+    end_time = job.end_time or time.time()
+    return {"url": job.website_url, "folder": job.base_folder,
+            "pages": job.run_stats["pages"], "bytes": job.run_stats["bytes"],
+            "unchanged": job.run_stats["unchanged"], "deduplicated": job.run_stats["deduplicated"],
+            "relinked": job.run_stats["relinked"], "seeded": job.run_stats["seeded"],
+            "asset_hits": job.asset_stats["hits"], "asset_misses": job.asset_stats["misses"],
+            "seconds": round(end_time - (job.start_time or end_time), 3), "canceled": job.cancel_flag.is_set()}
+
+def run_jobs(jobs, workers=copier.MAX_WORKERS, max_jobs=None, bandwidth=None,
+             parse_processes=copier.PARSE_PROCESSES, pool_size=None, write_bandwidth=None):
+    # Runs the jobs and returns a report per job. CopyJobs share one Scheduler; an
+    # AsyncCrawl runs on its own event loop and takes its task count from the job.
+    if any(not isinstance(job, copier.CopyJob) for job in jobs):
+        import async_copier
+        for job in jobs:
+            async_copier.run_job(job, parse_processes, write_bandwidth)
+    else:
+        copier.Scheduler(workers, max_jobs=max_jobs, bandwidth=bandwidth, parse_processes=parse_processes,
+                         pool_size=pool_size, write_bandwidth=write_bandwidth).run(jobs)
+    return [report(job) for job in jobs]
+
+def copy_site(website_url, target_folder, engine="threads", workers=None, parse_processes=copier.PARSE_PROCESSES,
+              pool_size=None, bandwidth=None, write_bandwidth=None, **options):
+    # Mirrors one site and returns its report. Blocks until the crawl finishes or the
+    # job's cancel_flag (pass one in to keep a handle on it) is set from another thread.
+    job = make_job(website_url, target_folder, engine, workers, **options)
+    return run_jobs([job], workers or copier.MAX_WORKERS, bandwidth=bandwidth,
+                    parse_processes=parse_processes, pool_size=pool_size, write_bandwidth=write_bandwidth)[0]
+
+def read_batch(path, root):
+    # One site per line: "URL [FOLDER]". Without a folder the site goes to root/<host>.
+    sites = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            folder = fields[1] if len(fields) > 1 else os.path.join(
+                root, re.sub(r"[^\w\-.]", "_", urlparse(fields[0]).netloc))
+            sites.append((fields[0], folder))
+    return sites
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Mirror a website into a local folder.")
+    parser.add_argument("url", nargs="?")
+    parser.add_argument("folder", help="target folder, or the root folder for --batch")
+    parser.add_argument("--batch", metavar="FILE", help='copy every "URL [FOLDER]" line of FILE (threads engine)')
+    parser.add_argument("--jobs", type=int, help="sites copied at once in --batch mode (default all)")
+    parser.add_argument("--bandwidth", type=float, metavar="MBPS", help="download budget for all sites together")
+    parser.add_argument("--write-bandwidth", type=float, metavar="MBPS", help="disk write budget for all sites together")
+    parser.add_argument("--engine", choices=ENGINES, default="threads")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="page workers shared by all sites (threads) or page tasks (asyncio)")
+    parser.add_argument("-d", "--depth", type=int, default=copier.MAX_DEPTH, help="maximum link depth")
+    parser.add_argument("-i", "--include", action="append", metavar="PATTERN",
+                        help="only follow links matching this fnmatch pattern (repeatable)")
+    parser.add_argument("-x", "--exclude", action="append", metavar="PATTERN",
+                        help="never follow links matching this fnmatch pattern (repeatable)")
+    parser.add_argument("--order", choices=("bfs", "dfs"), default=copier.CRAWL_ORDER)
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="start over instead of resuming an unfinished crawl")
+    parser.add_argument("--parse-processes", type=int, default=copier.PARSE_PROCESSES)
+    parser.add_argument("--visited-index", choices=("set", "hashed", "bloom"), default=copier.VISITED_INDEX)
+    parser.add_argument("--pool-size", type=int, help="connections per host (threads engine)")
+    parser.add_argument("--max-asset-size", type=int, default=copier.MAX_ASSET_SIZE, help="bytes, 0 for no limit")
+    parser.add_argument("--rate", type=float, default=fetcher.HOST_RATE,
+                        help="cap on requests per second per host (default: none, slow down only on 429/503)")
+    parser.add_argument("--user-agent", default=fetcher.USER_AGENT)
+    parser.add_argument("--http2", action="store_true",
+                        help="fetch through httpx, multiplexing each https host over one HTTP/2 connection (threads)")
+    parser.add_argument("--accept-encoding", metavar="CODINGS",
+                        help='e.g. "gzip, br" or "identity" (default: everything the transport can decode)')
+    parser.add_argument("--dns-ttl", type=float, metavar="SECONDS", help="cache the crawl's DNS answers this long")
+    parser.add_argument("--ignore-robots", action="store_true")
+    parser.add_argument("--progress", type=float, default=2.0, metavar="SECONDS",
+                        help="progress line interval on stderr, 0 to disable")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every saved or failed page")
+    parser.add_argument("--json", action="store_true", help="print the run statistics as JSON")
+    parser.add_argument("--archive", choices=archive.FORMATS,
+                        help="save into FOLDER/mirror.<format> instead of loose files (browse with archive.py)")
+    parser.add_argument("--no-sitemaps", dest="sitemaps", action="store_false",
+                        help="don't seed the crawl from robots.txt sitemaps, sitemap.xml and feeds")
+    parser.add_argument("--no-relink", dest="relink", action="store_false",
+                        help="leave page links pointing at the live site (see relink.py)")
+    parser.add_argument("--live-metrics", action="store_true",
+                        help="keep FOLDER/.copier/metrics.json updated during the run")
+    args = parser.parse_args(argv)
+    if bool(args.url) == bool(args.batch):
+        parser.error("give either a URL or --batch FILE")
+    if args.batch and args.engine != "threads":
+        parser.error("--batch needs the threads engine")
+    if args.http2 and args.engine != "threads":
+        parser.error("--http2 needs the threads engine")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    copier.MAX_ASSET_SIZE = args.max_asset_size or None
+    fetcher.HOST_RATE = args.rate
+    fetcher.USER_AGENT = args.user_agent
+    fetcher.RESPECT_ROBOTS = not args.ignore_robots
+    fetcher.TRANSPORT = "httpx" if args.http2 else "requests"
+    fetcher.ACCEPT_ENCODING = args.accept_encoding
+    if args.dns_ttl:
+        fetcher.enable_dns_cache(args.dns_ttl)
+
+    def log(message):
+        print(message, file=sys.stderr, flush=True)
+
+    sites = read_batch(args.batch, args.folder) if args.batch else [(args.url, args.folder)]
+    cancel_flag = threading.Event()
+    jobs = [make_job(url, folder, args.engine, args.workers, max_depth=args.depth, include=args.include,
+                     exclude=args.exclude, order=args.order, resume=args.resume,
+                     visited_index=args.visited_index, log_callback=log if args.verbose else None,
+                     cancel_flag=cancel_flag, live_metrics=args.live_metrics, archive_format=args.archive,
+                     relink=args.relink, sitemaps=args.sitemaps)
+            for url, folder in sites]
+    results = []
+    done = threading.Event()
+
+    def run():
+        try:
+            results.extend(run_jobs(jobs, args.workers or copier.MAX_WORKERS, max_jobs=args.jobs,
+                                    bandwidth=args.bandwidth and args.bandwidth * 1e6,
+                                    parse_processes=args.parse_processes, pool_size=args.pool_size,
+                                    write_bandwidth=args.write_bandwidth and args.write_bandwidth * 1e6))
+        finally:
+            done.set()
+
+    # The crawl runs on its own thread so Ctrl-C can cancel it cleanly: checkpoints are
+    # flushed and the next run with the same folders picks up where this one stopped.
+    # The engines' diagnostics go to stderr, leaving stdout for the --json report.
+    with contextlib.redirect_stdout(sys.stderr):
+        threading.Thread(target=run, daemon=True).start()
+        try:
+            while not done.wait(args.progress or None):
+                s = [job.progress_snapshot() for job in jobs]
+                log(f"{sum(x['pages'] for x in s)} pages, {sum(x['bytes'] for x in s) / 1e6:.1f} MB, "
+                    f"{sum(x['queued'] for x in s)} queued, {sum(x['seen'] for x in s)} seen")
+        except KeyboardInterrupt:
+            log("Canceling, saving progress...")
+            cancel_flag.set()
+            done.wait()
+    if not results:
+        return 1
+    for result in results:
+        log(f"{result['url']}: {result['pages']} pages, {result['bytes'] / 1e6:.1f} MB "
+            f"in {result['seconds']:.1f}s -> {result['folder']}")
+    if args.json:
+        print(json.dumps(results if args.batch else results[0], indent=2))
+    if cancel_flag.is_set():
+        return 130
+    return 0 if all(result["pages"] for result in results) else 1
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
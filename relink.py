@@ -0,0 +1,87 @@
+import argparse
+import os
+import sys
+from urllib.parse import urldefrag, urljoin
+import archive
+import css_rewrite
+import html_rewrite
+import urlnorm
+import writer
+from metastore import MetaStore, STATE_DIR
+
+# Points the <a href>s of saved pages at the mirrored copies of their targets. Runs at the end
+# of every finished crawl, or by hand: python relink.py ./out
+# The state database remembers which targets each page was last pointed at, so only pages
+# with a newly mirrored target (or saved again with live links) are read and rewritten.
+
+def link_replacements(page_url, page_path, text, local, local_paths):
+    # local maps page URLs to their files; local_paths is its values, for recognising hrefs
+    # an earlier pass already rewrote.
+    replacements = []
+    for href, start, end, quoted in html_rewrite.scan(text)[1]:
+        if not href or href.startswith("#") or href in local_paths:
+            continue
+        link, fragment = urldefrag(urljoin(page_url, href))
+        target = local.get(urlnorm.canonicalize(link))
+        if target:
+            value = css_rewrite.relative_path(target, page_path) + ("#" + fragment if fragment else "")
+            replacements.append((start, end, quoted, value))
+    return replacements
+
+def relink_pages(meta_store, page_writer, base_folder, log=None):
+    # Returns how many pages were rewritten.
+    pages = meta_store.pages()
+    local = {url: local_path for url, local_path, _ in pages if local_path}
+    local_paths = set(local.values())
+    done = meta_store.relinked_targets()
+    saved = []
+    for url, local_path, links in pages:
+        targets = sorted({link for link in links if link in local})
+        if not local_path or done.get(url) == targets:
+            continue
+        path = os.path.join(base_folder, local_path)
+        try:
+            text = page_writer.read(path).decode("utf-8", "surrogateescape")
+        except FileNotFoundError:
+            continue
+        replacements = link_replacements(url, local_path, text, local, local_paths)
+        future = None
+        if replacements:
+            page = html_rewrite.rewrite(text, replacements).encode("utf-8", "surrogateescape")
+            future = page_writer.write(path, page, url=url)
+        saved.append((url, targets, future))
+    relinked = []
+    for url, targets, future in saved:
+        if future is not None and future.exception() is not None:
+            if log is not None:
+                log(f"Failed to relink {url}: {future.exception()}")
+            continue
+        relinked.append((url, targets))
+    meta_store.set_relinked(relinked)
+    return sum(1 for _, _, future in saved if future is not None)
+
+def open_writer(base_folder):
+    # The mirror's own storage: its archive if it has one, loose files otherwise.
+    for archive_format in archive.FORMATS:
+        if os.path.exists(archive.archive_path(base_folder, archive_format)):
+            return archive.open_writer(base_folder, archive_format)
+    return writer.Writer()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Point a mirror's page links at its local copies.")
+    parser.add_argument("folder", help="the mirror's target folder")
+    args = parser.parse_args(argv)
+    if not os.path.exists(os.path.join(args.folder, STATE_DIR, "state.sqlite")):
+        parser.error(f"{args.folder} has no crawl state")
+    meta_store = MetaStore(args.folder)
+    page_writer = open_writer(args.folder)
+    try:
+        count = relink_pages(meta_store, page_writer, args.folder, log=lambda message: print(message, file=sys.stderr))
+    finally:
+        page_writer.close()
+        meta_store.close()
+    print(f"{count} pages relinked")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import io
+import zlib
+import xml.etree.ElementTree as ET
+from collections import deque
+from urllib.parse import urljoin, urlparse
+import fetcher
+
+# Sitemaps and feeds name pages up front, including ones no link reaches, so a crawl can
+# start with a full frontier instead of discovering it one page at a time.
+SITEMAP_PATHS = ("/sitemap.xml",)
+FEED_PATHS = ("/feed", "/rss.xml", "/atom.xml", "/feed.xml")
+MAX_SITEMAPS = 1000
+MISSING_STATUSES = (404, 410)
+# The sitemap protocol caps a file at 50 MB uncompressed; gzipped ones are cut off there too.
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+CHUNK_SIZE = 16 * 1024
+
+def robots_sitemaps(website_url):
+    # Sitemap: lines from robots.txt, read even when its rules are being ignored.
+    parsed = urlparse(website_url)
+    if fetcher.RESPECT_ROBOTS:
+        robots = fetcher.policy_for(website_url).robots
+    else:
+        robots = fetcher.load_robots(parsed.scheme, parsed.netloc)
+    return (robots.site_maps() if robots is not None else None) or []
+
+def decompress(body):
+    # A gzipped body that is cut short (always the case past MAX_DOCUMENT_SIZE) or corrupt
+    # partway still gives everything inflated before the damage. It is fed in small pieces so
+    # a corrupt one costs only its own output.
+    if body[:2] != b"\x1f\x8b":
+        return body
+    inflater = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    chunks = []
+    size = 0
+    try:
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = inflater.decompress(body[start:start + CHUNK_SIZE])
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= MAX_DOCUMENT_SIZE or inflater.eof:
+                break
+    except zlib.error:
+        pass
+    return b"".join(chunks)[:MAX_DOCUMENT_SIZE]
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+def parse(url, body):
+    # Returns (page URLs, sitemap URLs) found in a sitemap, sitemap index, RSS or Atom
+    # document. Elements are dropped as soon as they are read, so a 50k-entry sitemap never
+    # sits in memory as a tree. Anything that isn't XML gives nothing.
+    body = decompress(body)
+    if not body.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<"):
+        return [], []
+    pages = []
+    sitemaps = []
+    try:
+        for _, elem in ET.iterparse(io.BytesIO(body)):
+            name = local_name(elem.tag)
+            if name in ("url", "sitemap"):
+                for child in elem:
+                    if local_name(child.tag) == "loc" and child.text:
+                        (pages if name == "url" else sitemaps).append(urljoin(url, child.text.strip()))
+                elem.clear()
+            elif name == "item":
+                # RSS 2.0 and RSS 1.0 items carry the page in <link>.
+                for child in elem:
+                    if local_name(child.tag) == "link" and child.text:
+                        pages.append(urljoin(url, child.text.strip()))
+                elem.clear()
+            elif name == "entry":
+                # Atom entries can have several links; the alternate one is the page.
+                for child in elem:
+                    if local_name(child.tag) == "link" and child.get("rel", "alternate") == "alternate" \
+                            and child.get("href"):
+                        pages.append(urljoin(url, child.get("href").strip()))
+                elem.clear()
+    except ET.ParseError:
+        pass
+    return pages, sitemaps
+
+class Discovery:
+    # The sitemaps and feeds still to read for one site. Both engines drive it with their
+    # own transport: next_url() for the next document to fetch, read() with its body (None
+    # when it failed) for the page URLs in it. Sitemap indexes queue their children.
+    def __init__(self, website_url, sitemaps=()):
+        self.pending = deque(list(sitemaps) or [urljoin(website_url, path) for path in SITEMAP_PATHS])
+        self.pending.extend(urljoin(website_url, path) for path in FEED_PATHS)
+        self.seen = set(self.pending)
+
+    def next_url(self):
+        return self.pending.popleft() if self.pending else None
+
+    def read(self, url, body):
+        if body is None:
+            return []
+        pages, sitemaps = parse(url, body)
+        for child in sitemaps:
+            if child not in self.seen and len(self.seen) < MAX_SITEMAPS:
+                self.seen.add(child)
+                self.pending.append(child)
+        return pages
@@ -0,0 +1,65 @@
+import time
+import html_rewrite
+
+def spans(text):
+    assets, anchors = html_rewrite.scan(text)
+    return ([(kind, url, text[start:end]) for kind, url, start, end, _ in assets],
+            [(url, text[start:end]) for url, start, end, _ in anchors])
+
+def test_quoted_and_unquoted_values():
+    assets, anchors = spans('<img src="a.png"><script src=\'b.js\'></script><link href=c.css><a href = "d.html">')
+    assert assets == [("img", "a.png", "a.png"), ("script", "b.js", "b.js"), ("link", "c.css", "c.css")]
+    assert anchors == [("d.html", "d.html")]
+
+def test_quoted_value_containing_gt():
+    assets, _ = spans('<img alt="a > b" src="a.png"><img src="b.png">')
+    assert [url for _, url, _ in assets] == ["a.png", "b.png"]
+
+def test_apostrophe_in_unquoted_value():
+    assets, anchors = spans("<div title=O'Reilly><img src=a.png><a href='b.html'>x</a><p class=x'y>")
+    assert assets == [("img", "a.png", "a.png")]
+    assert anchors == [("b.html", "b.html")]
+
+def test_apostrophe_in_unquoted_asset_value():
+    assets, _ = spans("<img src=it's.png alt=x><img src=b.png>")
+    assert assets == [("img", "it's.png", "it's.png"), ("img", "b.png", "b.png")]
+
+def test_raw_text_bodies_are_skipped():
+    text = '<script>var s = "<img src=x.png>";</SCRIPT><img src=a.png><style>p{}</Style ><a href=b.html>'
+    assets, anchors = spans(text)
+    assert assets == [("img", "a.png", "a.png")]
+    assert anchors == [("b.html", "b.html")]
+
+def test_offsets_after_text_that_lowercases_longer():
+    # "İ".lower() is two characters, so searching a lowercased copy would shift every offset.
+    text = "<p>" + "İ" * 40 + "</p><script>x()</script><img src=a.png><style>b{background:url(c.png)}</style>"
+    assets, _ = spans(text)
+    assert assets == [("img", "a.png", "a.png"), ("style", "c.png", "c.png")]
+
+def test_unclosed_raw_text_runs_to_the_end():
+    assets, _ = spans("<script>document.write('<img src=x.png>')")
+    assert assets == []
+
+def test_comments_srcset_and_style_attributes():
+    text = ('<!-- <img src=x.png> --><img srcset="a.png 1x, b.png 2x">'
+            '<div style="background: url(\'c.png\')"></div>')
+    assets, _ = spans(text)
+    assert assets == [("srcset", "a.png", "a.png"), ("srcset", "b.png", "b.png"), ("style", "c.png", "c.png")]
+
+def test_entities_are_unescaped():
+    _, anchors = spans('<a href="page?a=1&amp;b=2">')
+    assert anchors == [("page?a=1&b=2", "page?a=1&amp;b=2")]
+
+def test_rewrite_round_trip():
+    text = "<div title=O'Reilly><img src=a.png><a href='b.html'>"
+    assets, anchors = html_rewrite.scan(text)
+    replacements = [(start, end, quoted, "assets/" + url) for _, url, start, end, quoted in assets]
+    replacements += [(start, end, quoted, "local/" + url) for url, start, end, quoted in anchors]
+    assert html_rewrite.rewrite(text, replacements) == \
+        "<div title=O'Reilly><img src=\"assets/a.png\"><a href='local/b.html'>"
+
+def test_unclosed_tag_ends_the_scan_in_linear_time():
+    started = time.perf_counter()
+    for text in ("<p class=x " * 5000, "<p class=x " * 5000 + 'a=">', "<!-- <p> " * 5000):
+        assert spans("<img src=a.png>" + text) == ([("img", "a.png", "a.png")], [])
+    assert time.perf_counter() - started < 1
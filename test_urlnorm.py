@@ -0,0 +1,29 @@
+import urlnorm
+from urlnorm import canonicalize
+
+def test_host_scheme_port_and_fragment():
+    assert canonicalize("HTTP://Example.COM:80/a#top") == "http://example.com/a"
+    assert canonicalize("https://example.com:8443") == "https://example.com:8443/"
+    assert canonicalize("http://[::1]:8080/x") == "http://[::1]:8080/x"
+
+def test_path_escapes_uppercased_and_trailing_slash_kept():
+    assert canonicalize("http://example.com/a%2fb/") == "http://example.com/a%2Fb/"
+    assert canonicalize("http://example.com/docs/") != canonicalize("http://example.com/docs")
+
+def test_query_pieces_are_not_reencoded():
+    assert canonicalize("http://example.com/p?print") == "http://example.com/p?print"
+    assert canonicalize("http://example.com/p?x=1;y=2") == "http://example.com/p?x=1;y=2"
+    assert canonicalize("http://example.com/p?q=a%20b+c") == "http://example.com/p?q=a%20b+c"
+
+def test_tracking_params_dropped_and_query_sorted():
+    url = "http://example.com/p?utm_source=x&b=2&fbclid=y&a=1&UTM_Medium=z"
+    assert canonicalize(url) == "http://example.com/p?a=1&b=2"
+    assert canonicalize("http://example.com/p?utm_source=x") == "http://example.com/p"
+    assert canonicalize("http://example.com/p?utm%5Fsource=x&a=1") == "http://example.com/p?a=1"
+
+def test_session_ids_are_kept():
+    assert canonicalize("http://example.com/p?sid=42") != canonicalize("http://example.com/p?sid=43")
+
+def test_sorting_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(urlnorm, "SORT_QUERY", False)
+    assert canonicalize("http://example.com/p?b=2&a=1") == "http://example.com/p?b=2&a=1"
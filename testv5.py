@@ -1,124 +1,30 @@
-import os
-import requests
+import collections
+import multiprocessing
+import queue
 import threading
 import time
-from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup
-import re
 import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter import filedialog
 
-visited = set()
-pause_flag = False
-cancel_flag = False
-
-def sanitize_filename(path):
-    name = os.path.basename(path)
-    if not name or '.' not in name:
-        name = 'index.html' if path == '/' else path.strip('/').replace('/', '_') + '.html'
-    return re.sub(r'[^\w\-_\.]', '_', name)
-
-def get_asset_folder(asset_url):
-    if asset_url.endswith('.css'):
-        return 'assets/css'
-    elif asset_url.endswith('.js'):
-        return 'assets/js'
-    elif asset_url.endswith(('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.bmp')):
-        return 'assets/images'
-    else:
-        return 'assets/other'
-
-def download_asset(asset_url, base_folder):
-    try:
-        response = requests.get(asset_url, timeout=10)
-        if response.status_code == 200:
-            parsed_url = urlparse(asset_url)
-            filename = os.path.basename(parsed_url.path)
-            filename = re.sub(r'[^\w\-_\.]', '_', filename) or 'file'
-            folder = get_asset_folder(asset_url)
-            local_folder = os.path.join(base_folder, folder)
-            os.makedirs(local_folder, exist_ok=True)
-            local_path = os.path.join(local_folder, filename)
-            with open(local_path, 'wb') as f:
-                f.write(response.content)
-            return os.path.relpath(local_path, start=base_folder).replace('\\', '/')
-    except:
-        pass
-    return None
-
-def copy_page(url, base_folder, base_domain, update_progress):
-    global visited, pause_flag, cancel_flag
-    if url in visited or cancel_flag:
-        return
-    visited.add(url)
-
-    while pause_flag:
-        time.sleep(0.1)
-        if cancel_flag:
-            return
-
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-    except Exception as e:
-        return
-
-    for tag in soup.find_all(["img", "script", "link"]):
-        attr = "src" if tag.name in ["img", "script"] else "href"
-        if tag.has_attr(attr):
-            asset_url = urljoin(url, tag[attr])
-            local_asset_path = download_asset(asset_url, base_folder)
-            if local_asset_path:
-                tag[attr] = local_asset_path
-
-    filename = sanitize_filename(urlparse(url).path)
-    html_path = os.path.join(base_folder, filename)
-    with open(html_path, 'w', encoding='utf-8') as f:
-        f.write(str(soup))
-
-    update_progress()
-
-    for a_tag in soup.find_all("a", href=True):
-        while pause_flag:
-            time.sleep(0.1)
-            if cancel_flag:
-                return
-        if cancel_flag:
-            return
-        link = urljoin(url, a_tag["href"])
-        parsed_link = urlparse(link)
-        if parsed_link.netloc == base_domain and parsed_link.scheme in ["http", "https"]:
-            copy_page(link, base_folder, base_domain, update_progress)
-
-def start_copy(website_url, target_folder, progress_callback, finish_callback):
-    global visited, cancel_flag
-    visited = set()
-    cancel_flag = False
-    os.makedirs(target_folder, exist_ok=True)
-    domain = urlparse(website_url).netloc
+# Worker threads never touch Tk; they post to a queue that the GUI thread drains this often.
+UI_REFRESH_MS = 250
+LOG_LINES = 500
+RATE_WINDOW = 5
 
-    start_time = time.time()
-
-    page_count = [0]
-
-    def update_progress():
-        page_count[0] += 1
-        elapsed = time.time() - start_time
-        estimated = (elapsed / page_count[0]) * (len(visited) + 1)
-        remaining = max(0, estimated - elapsed)
-        progress_callback(page_count[0], round(remaining))
-
-    copy_page(website_url, target_folder, domain, update_progress)
-
-    finish_callback()
+def load_engines():
+    # requests/urllib3 and aiohttp are most of the startup time, so they are imported here,
+    # on a background thread once the window is up, rather than at the top of the module.
+    # Plain import statements keep them visible to PyInstaller's analysis.
+    import copier
+    import async_copier
+    return copier, async_copier
 
 class App:
     def __init__(self, root):
         self.root = root
         self.root.title("Website Downloader")
-        self.root.geometry("500x350")
+        self.root.geometry("600x600")
         self.root.configure(bg="#1e1e1e")
 
         try:
@@ -126,13 +32,27 @@ class App:
         except:
             pass
 
+        self.events = queue.Queue()
+        self.engine_module = None
+        self.copier = None
+        self.async_copier = None
+        self.samples = collections.deque()
         self.create_widgets()
+        self.root.after(UI_REFRESH_MS, self.poll)
+        self.root.after_idle(lambda: threading.Thread(target=self.load, daemon=True).start())
+
+    def load(self):
+        try:
+            self.events.put(("ready", load_engines()))
+        except Exception as e:
+            self.events.put(("load_failed", e))
 
     def create_widgets(self):
         style = ttk.Style()
         style.theme_use("default")
         style.configure("TButton", background="#2c2c2c", foreground="white")
         style.configure("TLabel", background="#1e1e1e", foreground="white")
+        style.configure("TFrame", background="#1e1e1e")
         style.configure("TEntry", fieldbackground="#2c2c2c", foreground="white")
         style.configure("TProgressbar", background="#00ff00")
 
@@ -146,7 +66,14 @@ class App:
 
         ttk.Button(self.root, text="Browse...", command=self.browse_folder).pack(pady=3)
 
-        self.start_btn = ttk.Button(self.root, text="Start", command=self.start_download)
+        self.engine = tk.StringVar(value="Threads")
+        engine_frame = ttk.Frame(self.root)
+        engine_frame.pack(pady=3)
+        ttk.Label(engine_frame, text="Engine:").pack(side="left", padx=5)
+        ttk.Combobox(engine_frame, textvariable=self.engine, values=["Threads", "Asyncio"],
+                     state="readonly", width=10).pack(side="left")
+
+        self.start_btn = ttk.Button(self.root, text="Start", command=self.start_download, state="disabled")
         self.start_btn.pack(pady=5)
 
         # self.pause_btn = ttk.Button(self.root, text="Pause", command=self.pause_download)
@@ -158,9 +85,15 @@ class App:
         self.progress = ttk.Progressbar(self.root, length=400, mode="indeterminate")
         self.progress.pack(pady=10)
 
-        self.status_label = ttk.Label(self.root, text="")
+        self.status_label = ttk.Label(self.root, text="Loading...")
         self.status_label.pack()
 
+        self.stats_label = ttk.Label(self.root, text="")
+        self.stats_label.pack(pady=3)
+
+        self.log_text = tk.Text(self.root, height=10, width=70, bg="#2c2c2c", fg="white", state="disabled")
+        self.log_text.pack(pady=5, fill="both", expand=True)
+
         ttk.Label(self.root, text="© Made by Md. Shahinur Islamm\nshahinalam6644@gmail.com", font=("Arial", 8),anchor="center",justify="center").pack(side="bottom", pady=5)
 
     def browse_folder(self):
@@ -170,9 +103,9 @@ class App:
             self.folder_entry.insert(0, folder)
 
     def start_download(self):
-        global pause_flag, cancel_flag
-        pause_flag = False
-        cancel_flag = False
+        copier, async_copier = self.copier, self.async_copier
+        copier.pause_flag.clear()
+        copier.cancel_flag.clear()
         url = self.url_entry.get()
         folder = self.folder_entry.get()
 
@@ -180,30 +113,100 @@ class App:
             messagebox.showwarning("Warning", "Please enter both URL and folder name")
             return
 
+        start_copy = copier.start_copy
+        if self.engine.get() == "Asyncio":
+            if async_copier.aiohttp is None:
+                messagebox.showerror("Error", "The Asyncio engine needs aiohttp (pip install aiohttp)")
+                return
+            start_copy = async_copier.start_copy
+
         self.progress.start()
         self.status_label.config(text="Downloading...")
+        self.engine_module = async_copier if start_copy is async_copier.start_copy else copier
+        self.samples = collections.deque([(time.monotonic(), 0, 0)])
 
-        def update_progress(pages, remaining):
-            self.status_label.config(text=f"Downloaded {pages} page(s). Estimated time left: {remaining}s")
+        def log(message):
+            self.events.put(("log", message))
 
         def finish():
+            self.events.put(("finish", None))
+
+        threading.Thread(target=start_copy, args=(url, folder, lambda pages, remaining: None, finish),
+                         kwargs={"log_callback": log}, daemon=True).start()
+
+    def poll(self):
+        lines = []
+        finished = False
+        while True:
+            try:
+                kind, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "log":
+                lines.append(value)
+            elif kind == "finish":
+                finished = True
+            elif kind == "ready":
+                self.copier, self.async_copier = value
+                self.start_btn.config(state="normal")
+                self.status_label.config(text="")
+            elif kind == "load_failed":
+                self.status_label.config(text=f"Failed to load the downloader: {value}")
+        if lines:
+            self.append_log(lines[-LOG_LINES:])
+        if self.engine_module is not None:
+            self.show_stats(self.engine_module.progress_snapshot())
+        if finished:
+            self.engine_module = None
             self.progress.stop()
-            self.status_label.config(text="✅ Download Complete")
-
-        threading.Thread(target=start_copy, args=(url, folder, update_progress, finish), daemon=True).start()
+            if not self.copier.cancel_flag.is_set():
+                asset_stats = self.copier.asset_stats
+                self.status_label.config(text=f"✅ Download Complete\nAssets: {asset_stats['misses']} fetched, {asset_stats['hits']} reused")
+        self.root.after(UI_REFRESH_MS, self.poll)
+
+    def append_log(self, lines):
+        self.log_text.config(state="normal")
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_LINES
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        self.log_text.see(tk.END)
+        self.log_text.config(state="disabled")
+
+    def show_stats(self, snapshot):
+        # Rates are over the last RATE_WINDOW seconds rather than the whole run, so they follow slowdowns.
+        now = time.monotonic()
+        self.samples.append((now, snapshot["pages"], snapshot["bytes"]))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= RATE_WINDOW:
+            self.samples.popleft()
+        then, pages, size = self.samples[0]
+        elapsed = max(now - then, 1e-6)
+        page_rate = (snapshot["pages"] - pages) / elapsed
+        byte_rate = (snapshot["bytes"] - size) / elapsed
+        eta = f"{snapshot['queued'] / page_rate:.0f}s" if page_rate > 0 else "?"
+        self.stats_label.config(text=f"{snapshot['pages']} pages, {snapshot['bytes'] / 1e6:.1f} MB | "
+                                     f"{page_rate:.1f} pages/s, {byte_rate / 1e6:.2f} MB/s | "
+                                     f"queue {snapshot['queued']} | ETA {eta}")
 
     def pause_download(self):
-        global pause_flag
-        pause_flag = not pause_flag
-        self.pause_btn.config(text="Resume" if pause_flag else "Pause")
+        if self.copier is None:
+            return
+        pause_flag = self.copier.pause_flag
+        if pause_flag.is_set():
+            pause_flag.clear()
+        else:
+            pause_flag.set()
+        self.pause_btn.config(text="Resume" if pause_flag.is_set() else "Pause")
 
     def cancel_download(self):
-        global cancel_flag
-        cancel_flag = True
+        if self.copier is None:
+            return
+        self.copier.cancel_flag.set()
         self.progress.stop()
         self.status_label.config(text="❌ Download Canceled")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = App(root)
     root.mainloop()
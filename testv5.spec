@@ -1,5 +1,16 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+# Everything bundled is unpacked on every cold start of the one-file exe, so modules the app
+# never imports are left out: the old BeautifulSoup parser stack, optional urllib3/requests
+# extras (pyOpenSSL, SOCKS), the httpx/HTTP/2 transport (mirror.py --http2 only) and stdlib
+# tooling. Check startup with import_budget.py.
+EXCLUDES = [
+    'bs4', 'soupsieve', 'html5lib', 'lxml',
+    'cryptography', 'OpenSSL', 'socks', 'httpx', 'httpcore', 'h2', 'hpack', 'hyperframe',
+    'unittest', 'doctest', 'pydoc', 'pdb', 'lib2to3', 'distutils', 'setuptools', 'pip', 'xmlrpc',
+    'tkinter.test', 'test',
+    'numpy', 'matplotlib', 'PIL', 'IPython',
+]
 
 a = Analysis(
     ['testv5.py'],
@@ -10,7 +21,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=EXCLUDES,
     noarchive=False,
     optimize=0,
 )
@@ -26,7 +37,9 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # UPX-packed libraries have to be unpacked again on every load, which costs more startup
+    # time than the smaller download saves.
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
@@ -0,0 +1,108 @@
+import hashlib
+import math
+import re
+from fnmatch import fnmatch
+from urllib.parse import unquote_plus, urldefrag, urlsplit, urlunsplit
+
+# Query parameters that never change what a page shows; fnmatch patterns, compared lowercase.
+DROP_PARAMS = ["utm_*", "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl",
+               "yclid", "igshid", "ref_src", "phpsessid", "jsessionid"]
+# The canonical URL is also the one fetched, and /docs/ and /docs aren't the same resource on
+# servers that don't redirect one to the other, so the slash is kept unless asked for.
+STRIP_TRAILING_SLASH = False
+SORT_QUERY = True
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def dropped_param(name):
+    name = name.lower()
+    return any(fnmatch(name, pattern) for pattern in DROP_PARAMS)
+
+def canonicalize(url):
+    # One spelling per page: no fragment, lowercase scheme and host, no default port,
+    # tracking parameters removed, query sorted, optional trailing slash removed.
+    url = urldefrag(url)[0]
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    try:
+        port = parts.port
+    except ValueError:
+        return url
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = "[" + host + "]"
+    netloc = host if port is None or port == DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+    if parts.username:
+        userinfo = parts.username + (":" + parts.password if parts.password else "")
+        netloc = userinfo + "@" + netloc
+    path = re.sub(r"%[0-9a-f]{2}", lambda m: m.group().upper(), parts.path) or "/"
+    if STRIP_TRAILING_SLASH and len(path) > 1:
+        path = path.rstrip("/") or "/"
+    # The canonical URL is the one fetched, so the query's pieces are dropped and reordered
+    # as they were written: decoding and re-encoding them would change what the server gets.
+    query = [piece for piece in parts.query.split("&")
+             if piece and not dropped_param(unquote_plus(piece.partition("=")[0]))]
+    if SORT_QUERY:
+        query.sort()
+    return urlunsplit((scheme, netloc, path, "&".join(query), ""))
+
+def url_allowed(url, include=None, exclude=None):
+    # include/exclude are fnmatch patterns against the whole canonical URL, e.g. "*/blog/*".
+    # With include patterns a URL has to match one of them; exclude always wins.
+    if include and not any(fnmatch(url, pattern) for pattern in include):
+        return False
+    return not (exclude and any(fnmatch(url, pattern) for pattern in exclude))
+
+class BloomFilter:
+    # Fixed-size bit array sized for capacity entries at error_rate false positives.
+    # A false positive means a page is treated as already seen and skipped.
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key):
+        # Returns True when key was not (probably) present before.
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        new = False
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % self.size
+            mask = 1 << (bit & 7)
+            if not self.bits[bit >> 3] & mask:
+                self.bits[bit >> 3] |= mask
+                new = True
+        return new
+
+class VisitedIndex:
+    # The crawl's seen-URL set. "set" keeps the URLs themselves, "hashed" keeps an
+    # 8-byte digest per URL (about a tenth of the memory, collisions negligible), and
+    # "bloom" keeps a Bloom filter of fixed size regardless of how many URLs it sees.
+    def __init__(self, mode="set", capacity=10_000_000, error_rate=0.0001):
+        self.mode = mode
+        self.count = 0
+        if mode == "bloom":
+            self.items = BloomFilter(capacity, error_rate)
+        elif mode in ("set", "hashed"):
+            self.items = set()
+        else:
+            raise ValueError(f"unknown visited index {mode!r}")
+
+    def add(self, url):
+        if self.mode == "bloom":
+            new = self.items.add(url)
+        else:
+            key = url if self.mode == "set" else hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+            new = key not in self.items
+            if new:
+                self.items.add(key)
+        if new:
+            self.count += 1
+        return new
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,124 @@
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import fetcher
+
+WRITER_THREADS = 4
+MAX_QUEUED_BYTES = 64 * 1024 * 1024
+BATCH_SIZE = 64
+
+created_folders = set()
+created_folders_lock = threading.Lock()
+
+def makedirs(folder):
+    # Every asset lands in one of a handful of folders; create each once per process
+    # instead of paying os.makedirs' stat per path component on every file.
+    if folder in created_folders:
+        return
+    os.makedirs(folder, exist_ok=True)
+    with created_folders_lock:
+        created_folders.add(folder)
+
+def forget_folder(folder):
+    with created_folders_lock:
+        created_folders.discard(folder)
+
+def make_temp_file(folder, suffix='.part'):
+    # mkstemp in folder, recreating it if it was removed since it was cached.
+    makedirs(folder)
+    try:
+        return tempfile.mkstemp(dir=folder, suffix=suffix)
+    except FileNotFoundError:
+        forget_folder(folder)
+        makedirs(folder)
+        return tempfile.mkstemp(dir=folder, suffix=suffix)
+
+class Writer:
+    # The disk stage of a run. Callers hand over finished bytes and get a Future back
+    # straight away; writer threads take queued files in batches, write each to a temporary
+    # name and rename it into place. Queued bytes are capped at max_queued_bytes, so a slow
+    # disk holds back the downloads instead of filling memory, and bandwidth (bytes per
+    # second) caps disk throughput for everything sharing the writer.
+    def __init__(self, threads=WRITER_THREADS, max_queued_bytes=MAX_QUEUED_BYTES, bandwidth=None):
+        self.cond = threading.Condition()
+        self.items = deque()
+        self.queued_bytes = 0
+        self.max_queued_bytes = max_queued_bytes
+        self.bandwidth = fetcher.Bandwidth(bandwidth) if bandwidth else None
+        self.closed = False
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(max(1, threads))]
+        for t in self.threads:
+            t.start()
+
+    def write(self, path, data, metrics=None, url=None):
+        # Returns a Future that resolves to path once data is on disk. Blocks only while the
+        # queue is full, and never on a writer thread (done callbacks run there). url is the
+        # address the data came from, for writers that record it.
+        future = Future()
+        with self.cond:
+            if threading.current_thread() not in self.threads:
+                while self.queued_bytes and self.queued_bytes + len(data) > self.max_queued_bytes:
+                    self.cond.wait()
+            self.items.append((path, data, metrics, url, future))
+            self.queued_bytes += len(data)
+            self.cond.notify()
+        return future
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def store(self, path, part_path, url=None):
+        # Moves a finished part file (see make_temp_file) into place.
+        os.replace(part_path, path)
+
+    def write_now(self, path, data, url=None):
+        if self.bandwidth is not None:
+            self.bandwidth.consume(len(data))
+        fd, part_path = make_temp_file(os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(part_path, path)
+        except BaseException:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.items and not self.closed:
+                    self.cond.wait()
+                if not self.items:
+                    return
+                batch = [self.items.popleft() for _ in range(min(BATCH_SIZE, len(self.items)))]
+            for path, data, metrics, url, future in batch:
+                started = time.perf_counter()
+                try:
+                    self.write_now(path, data, url)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    if metrics is not None:
+                        metrics.observe("write", time.perf_counter() - started)
+                    future.set_result(path)
+            with self.cond:
+                self.queued_bytes -= sum(len(item[1]) for item in batch)
+                self.cond.notify_all()
+
+    def close(self):
+        # Finishes everything queued, then stops the threads.
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        for t in self.threads:
+            t.join()